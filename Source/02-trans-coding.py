@@ -1,16 +1,67 @@
 # 2-trans-coding.py
 # Jeff He @ Apr. 8
 
-import chardet
-import pandas as pd
 import os
+import codecs
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import chardet
+from corpus_io import REPORT_DIR, list_month_files
+
+SAMPLE_SIZE = 1 << 16
+BLOCK_SIZE = 1 << 20
+# chardet reports the narrowest charset that fits the sample, widen it to the superset
+ENCODING_ALIASES = {"ascii": "utf-8", "gb2312": "gb18030", "gbk": "gb18030"}
+
+def detect_encoding(file_path, sample_size=SAMPLE_SIZE):
+    with open(file_path, "rb") as file:
+        sample = file.read(sample_size)
+    if sample.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    encoding = (chardet.detect(sample)["encoding"] or "utf-8").lower()
+    return ENCODING_ALIASES.get(encoding, encoding)
+
+def normalize_file(file_path, errors="strict"):
+    file_name = os.path.basename(file_path)
+    encoding = detect_encoding(file_path)
+    if encoding == "utf-8":
+        return file_name, encoding, "skipped"
+
+    tmp_path = file_path + ".tmp"
+    decoder = codecs.getincrementaldecoder(encoding)(errors=errors)
+    try:
+        with open(file_path, "rb") as src, open(tmp_path, "wb") as dst:
+            first = True
+            while True:
+                block = src.read(BLOCK_SIZE)
+                text = decoder.decode(block, final=not block)
+                if first and text:
+                    # a BOM carried over from a non-UTF-8 encoding
+                    text = text.lstrip("\ufeff")
+                    first = False
+                dst.write(text.encode("utf-8"))
+                if not block:
+                    break
+            dst.flush()
+            os.fsync(dst.fileno())
+    except (UnicodeDecodeError, LookupError) as e:
+        os.remove(tmp_path)
+        return file_name, encoding, f"failed: {e}"
+    # the original is only replaced once the transcoded copy is complete on disk
+    os.replace(tmp_path, file_path)
+    return file_name, encoding, "converted"
 
-file_path = r"D:\Projects\sina-report\2015-01.csv"
+def main():
+    parser = argparse.ArgumentParser(description="normalize every report CSV to UTF-8 without BOM")
+    parser.add_argument("--path", default=REPORT_DIR)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--errors", default="strict", choices=["strict", "replace", "ignore"])
+    args = parser.parse_args()
 
-with open(file_path, "rb") as file:
-    print(chardet.detect(file.read()))
+    files = [os.path.join(args.path, f) for f in list_month_files(args.path)]
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        for file_name, encoding, status in pool.map(normalize_file, files, [args.errors] * len(files)):
+            print(f"{file_name} ({encoding}) : {status}")
 
-df = pd.read_csv(file_path, encoding='utf-8-sig')
-os.remove(file_path)
-new_path = file_path
-new_df = df.to_csv(new_path, encoding="utf-8", index=False)
\ No newline at end of file
+if __name__ == "__main__":
+    main()
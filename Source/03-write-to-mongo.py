@@ -1,33 +1,180 @@
 # 3-write-to-mongo.py
 # Jeff He @ Apr. 8
 
+import os
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import pandas as pd
 import pymongo
-import os
+from corpus_io import (REPORT_DIR, URL_FIELD, split_month, iter_report_chunks, build_records,
+                       build_manifest, load_manifest, save_manifest, diff_manifest, save_touched)
+from report_store import BACKENDS, STORE_DIR, RAW_TABLE, write_month, partition_path
+
+MONGO_URI = "mongodb://localhost:27017/"
+DB_NAME = "stock_reports_db"
+COLLECTION_NAME = "reports"
+CHUNK_SIZE = 20000
+BATCH_SIZE = 1000
+INGEST_MANIFEST = "ingest_manifest.json"
+TOUCHED_FILE = "touched.json"
+
+_collection = None
+
+def get_collection():
+    # one client per worker process, pymongo clients are not fork-safe
+    global _collection
+    if _collection is None:
+        _collection = pymongo.MongoClient(MONGO_URI)[DB_NAME][COLLECTION_NAME]
+    return _collection
+
+def duplicate_urls(collection):
+    # URLs held by more than one document, with their _ids in insertion order
+    return list(collection.aggregate([
+        {"$match": {URL_FIELD: {"$type": "string"}}},
+        {"$sort": {"_id": 1}},
+        {"$group": {"_id": f"${URL_FIELD}", "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+    ], allowDiskUse=True))
+
+def ensure_indexes(drop_duplicates=False):
+    # a collection filled before the unique URL index existed may hold the same report twice,
+    # and create_index would only fail with a DuplicateKeyError naming one of them
+    client = pymongo.MongoClient(MONGO_URI)
+    collection = client[DB_NAME][COLLECTION_NAME]
+    try:
+        if not any(index.get("unique") and URL_FIELD in index["key"] for index in collection.list_indexes()):
+            duplicates = duplicate_urls(collection)
+            if duplicates and not drop_duplicates:
+                for group in duplicates[:20]:
+                    print(f"{group['_id']} : {group['count']} documents")
+                raise SystemExit(f"{len(duplicates)} URLs are stored more than once, so the unique index on "
+                                 f"{URL_FIELD} cannot be built; rerun with --drop-duplicates to keep the "
+                                 f"first document of each")
+            extra = [i for group in duplicates for i in group["ids"][1:]]
+            for start in range(0, len(extra), BATCH_SIZE):
+                collection.delete_many({"_id": {"$in": extra[start:start + BATCH_SIZE]}})
+            if extra:
+                print(f"removed {len(extra)} duplicate documents of {len(duplicates)} URLs")
+        collection.create_index(
+            [(URL_FIELD, pymongo.ASCENDING)],
+            unique=True,
+            partialFilterExpression={URL_FIELD: {"$type": "string"}})
+        collection.create_index([("年份", pymongo.ASCENDING), ("月份", pymongo.ASCENDING)])
+    finally:
+        client.close()
+
+def month_filter(file_name):
+    year, month = split_month(file_name)
+    return {"年份": year, "月份": month}
+
+def to_operations(records):
+    ops = []
+    for record in records:
+        url = record.get(URL_FIELD)
+        if url:
+            ops.append(pymongo.ReplaceOne({URL_FIELD: url}, record, upsert=True))
+        else:
+            ops.append(pymongo.InsertOne(record))
+    return ops
+
+def load_month_file(file_path, chunksize=CHUNK_SIZE, batch_size=BATCH_SIZE):
+    collection = get_collection()
+    file_name = os.path.basename(file_path)
+    total = upserted = 0
+    urls = []
+    for chunk in iter_report_chunks(file_path, chunksize):
+        records = build_records(chunk, file_name)
+        urls.extend(r[URL_FIELD] for r in records if r.get(URL_FIELD))
+        ops = to_operations(records)
+        for start in range(0, len(ops), batch_size):
+            result = collection.bulk_write(ops[start:start + batch_size], ordered=False)
+            upserted += result.upserted_count + result.inserted_count
+        total += len(ops)
+    return file_name, total, upserted, urls
+
+def ids_of(collection, query):
+    return [doc["_id"] for doc in collection.find(query, {"_id": 1})]
+
+def replace_month(file_path, chunksize=CHUNK_SIZE):
+    # upserting by URL keeps the _id of unchanged reports, so only reports that left
+    # the file are deleted; rows without a URL cannot be matched and are reinserted
+    collection = get_collection()
+    month_query = month_filter(os.path.basename(file_path))
+    removed = ids_of(collection, {**month_query, URL_FIELD: {"$not": {"$type": "string"}}})
+    file_name, total, upserted, urls = load_month_file(file_path, chunksize)
+    removed += ids_of(collection, {**month_query, URL_FIELD: {"$type": "string", "$nin": urls}})
+    collection.delete_many({"_id": {"$in": removed}})
+    touched = ids_of(collection, month_query) + removed
+    return file_name, total, upserted, [str(i) for i in touched]
+
+def remove_month(file_name):
+    collection = get_collection()
+    removed = ids_of(collection, month_filter(file_name))
+    collection.delete_many({"_id": {"$in": removed}})
+    return file_name, 0, 0, [str(i) for i in removed]
+
+def load_month_parquet(file_path, store_dir, chunksize=CHUNK_SIZE):
+    # a month file maps to one partition, rewriting it is naturally idempotent
+    file_name = os.path.basename(file_path)
+    year, month = split_month(file_name)
+    df = pd.concat(iter_report_chunks(file_path, chunksize), ignore_index=True)
+    total = write_month(store_dir, RAW_TABLE, year, month, df)
+    return file_name, total, total, [f"{year}-{month}"]
+
+def remove_month_parquet(file_name, store_dir):
+    year, month = split_month(file_name)
+    path = partition_path(store_dir, RAW_TABLE, year, month)
+    if os.path.exists(path):
+        os.remove(path)
+    return file_name, 0, 0, [f"{year}-{month}"]
+
+def main():
+    parser = argparse.ArgumentParser(description="bulk, idempotent load of the monthly report CSVs")
+    parser.add_argument("--path", default=REPORT_DIR)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--chunksize", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--backend", choices=BACKENDS, default="mongo")
+    parser.add_argument("--store", default=STORE_DIR)
+    parser.add_argument("--manifest", default=INGEST_MANIFEST)
+    parser.add_argument("--touched", default=TOUCHED_FILE)
+    parser.add_argument("--full", action="store_true", help="reload every month regardless of the manifest")
+    parser.add_argument("--drop-duplicates", action="store_true",
+                        help="before building the unique URL index, keep only the first document of each URL")
+    args = parser.parse_args()
+
+    current = build_manifest(args.path, args.workers)
+    loaded = {"files": {}} if args.full else load_manifest(args.manifest)
+    changed, removed = diff_manifest(loaded, current)
+    print(f"{len(changed)} new or changed, {len(removed)} removed, "
+          f"{len(current['files']) - len(changed)} unchanged")
+
+    grand_total = 0
+    touched = []
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        if args.backend == "parquet":
+            futures = [pool.submit(load_month_parquet, os.path.join(args.path, f), args.store, args.chunksize)
+                       for f in changed]
+            futures += [pool.submit(remove_month_parquet, f, args.store) for f in removed]
+        else:
+            ensure_indexes(args.drop_duplicates)
+            futures = [pool.submit(replace_month, os.path.join(args.path, f), args.chunksize) for f in changed]
+            futures += [pool.submit(remove_month, f) for f in removed]
+        for future in as_completed(futures):
+            file_name, total, upserted, month_touched = future.result()
+            grand_total += total
+            touched.extend(month_touched)
+            # record each month as soon as it lands so an interrupted run resumes where it stopped;
+            # its touched entries go first, so a month in the manifest is never missing from them
+            save_touched(args.touched, args.backend, month_touched)
+            if file_name in current["files"]:
+                loaded["files"][file_name] = current["files"][file_name]
+            else:
+                loaded["files"].pop(file_name, None)
+            loaded["total_rows"] = sum(entry["rows"] for entry in loaded["files"].values())
+            save_manifest(loaded, args.manifest)
+            print(f"{file_name} is done ({total} rows, {upserted} new)")
+
+    print(f"All done, {grand_total} rows, {len(touched)} touched")
 
-mongo_client = pymongo.MongoClient("mongodb://localhost:27017/")
-db = mongo_client["stock_reports_db"]
-collection = db["reports"]
-path = r"D:\Projects\sina-report"
-
-for file_name in os.listdir(path):
-    if file_name.endswith(".csv"):
-        file_path = os.path.join(path, file_name)
-        df = pd.read_csv(file_path)
-
-        for _, row in df.iterrows():
-            record = {
-                "Ʊ": row["Ʊ"],
-                "ȯ̼": row["ȯ̼"],
-                "": row[""],
-                "б": row["б"],
-                "": row[""],
-                "бı": row["бı"],
-                "оԱ": row["оԱ"],
-                "": file_name.split('-')[0],
-                "·": file_name.split('-')[1].split('.')[0]
-            }
-            collection.insert_one(record)
-    print(f"{file_name} is done")
-
-print("All done")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
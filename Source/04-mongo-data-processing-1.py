@@ -1,43 +1,57 @@
 # 4-mongo-data-processing-1.py
 # Jeff He @ Apr. 8
 
+import argparse
 import pymongo
-import re
-
-mongo_client = pymongo.MongoClient("mongodb://localhost:27017/")
-db = mongo_client['stock_reports_db']
-collection = db['reports']
-counter = 0
-op_buffer = []
-
-def clean_escaped_characters(text):
-    if isinstance(text, str):
-        processed = re.sub(r'[\n\r\t]', '', text)
-        processed = re.sub(r'[^a-zA-Z0-9\u4e00-\u9fa5\s,.!:;()\-+*/&^%$#@=_<>]', '', processed)
-        return processed
-    return text
-
-def remove_risk_warning(text):
-    if isinstance(text, str):
-        processed = re.sub(r'ʾ[^\n]*', '', text)
-        return processed
-    return text
-
-for doc in collection.find():
-    report = doc.get('бı', '')
-
-    if report:
-        processed_text = clean_escaped_characters(report)
-        cleaned_text = remove_risk_warning(processed_text)
-        op_buffer.append(pymongo.UpdateOne(
-                {'_id': doc['_id']},
-                {'$set': {'бı': cleaned_text}}))
-    counter += 1
-    if counter % 1000 == 0:
+from text_cleaning import clean_escaped_characters, remove_risk_warning
+from report_store import (BACKENDS, STORE_DIR, RAW_TABLE, list_months, read_month, write_month,
+                          find_by_ids, touched_scope)
+
+def process_mongo(ids=None):
+    mongo_client = pymongo.MongoClient("mongodb://localhost:27017/")
+    db = mongo_client['stock_reports_db']
+    collection = db['reports']
+    counter = 0
+    op_buffer = []
+
+    for doc in find_by_ids(collection, ids):
+        report = doc.get('研报文本', '')
+
+        if report:
+            processed_text = clean_escaped_characters(report)
+            cleaned_text = remove_risk_warning(processed_text)
+            op_buffer.append(pymongo.UpdateOne(
+                    {'_id': doc['_id']},
+                    {'$set': {'研报文本': cleaned_text}}))
+        counter += 1
+        if counter % 1000 == 0 and op_buffer:
+            collection.bulk_write(op_buffer)
+            op_buffer = []
+
+    if op_buffer:
         collection.bulk_write(op_buffer)
-        op_buffer = []
 
-if op_buffer:
-    collection.bulk_write(op_buffer)
-
-print("data processing I done")
\ No newline at end of file
+def process_parquet(store_dir, months=None):
+    existing = list_months(store_dir, RAW_TABLE)
+    for year, month in existing if months is None else [m for m in months if m in existing]:
+        df = read_month(store_dir, RAW_TABLE, year, month)
+        df['研报文本'] = df['研报文本'].map(lambda text: remove_risk_warning(clean_escaped_characters(text)))
+        write_month(store_dir, RAW_TABLE, year, month, df)
+        print(f"{year}-{month} is done")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backend", choices=BACKENDS, default="mongo")
+    parser.add_argument("--store", default=STORE_DIR)
+    parser.add_argument("--touched", help="only process what 03 reported in this touched file")
+    args = parser.parse_args()
+
+    ids, months = touched_scope(args.touched)
+    if args.backend == "parquet":
+        process_parquet(args.store, months)
+    else:
+        process_mongo(ids)
+    print("data processing I done")
+
+if __name__ == "__main__":
+    main()
@@ -1,48 +1,79 @@
 # 5-mongo-data-processing-2.py
 # Jeff He @ Apr. 8
 
+import os
+import argparse
 import pymongo
-import re
-
-mongo_client = pymongo.MongoClient("mongodb://localhost:27017/")
-db = mongo_client['stock_reports_db']
-collection = db['reports']
-new = mongo_client['processed_stock_reports_db']
-new_collection = new['processed_reports']
-op_buffer = []
-
-def split_by_sentence(text):
-    if isinstance(text, str):
-        sentences = re.split(r'(?<=)', text)
-        sentences = [sentence.strip() for sentence in sentences if sentence.strip()]
-        return sentences
-    return []
-
-def is_meaningless(text):
-    phrases = ["Դ", "", "治Ͷʽ", "", "Դ", ""]
-    for phrase in phrases:
-        if text.startswith(phrase):
-            return True
-    return False
-
-for doc in collection.find():
-    report = doc.get('бı', '')
-    if report:
-        split_sentences = split_by_sentence(report)
-        filtered = [sentence for sentence in split_sentences if not is_meaningless(sentence)]
-        if filtered:
-            new_doc = doc.copy()
-            new_doc['бı'] = filtered
-            op_buffer.append(pymongo.InsertOne(new_doc))
-        else:
-            new_doc = doc.copy()
-            del new_doc['бı']
-            op_buffer.append(pymongo.InsertOne(new_doc))
-    if len(op_buffer) >= 1000:
+from text_cleaning import filter_report
+from report_store import (BACKENDS, STORE_DIR, RAW_TABLE, PROCESSED_TABLE, list_months, read_month, write_month,
+                          partition_path, find_by_ids, touched_scope, consume_touched)
+
+def process_mongo(ids=None):
+    mongo_client = pymongo.MongoClient("mongodb://localhost:27017/")
+    db = mongo_client['stock_reports_db']
+    collection = db['reports']
+    new = mongo_client['processed_stock_reports_db']
+    new_collection = new['processed_reports']
+    op_buffer = []
+    seen = set()
+
+    # replacing by _id keeps reruns and incremental runs from duplicating documents
+    for doc in find_by_ids(collection, ids):
+        seen.add(doc['_id'])
+        report = doc.get('研报文本', '')
+        if report:
+            filtered = filter_report(report)
+            if filtered:
+                new_doc = doc.copy()
+                new_doc['研报文本'] = filtered
+                op_buffer.append(pymongo.ReplaceOne({'_id': doc['_id']}, new_doc, upsert=True))
+            else:
+                new_doc = doc.copy()
+                del new_doc['研报文本']
+                op_buffer.append(pymongo.ReplaceOne({'_id': doc['_id']}, new_doc, upsert=True))
+        elif ids is not None:
+            op_buffer.append(pymongo.DeleteOne({'_id': doc['_id']}))
+        if len(op_buffer) >= 1000:
+            new_collection.bulk_write(op_buffer)
+            op_buffer = []
+
+    if ids is not None:
+        # reports deleted from the raw collection by an incremental ingest
+        op_buffer.extend(pymongo.DeleteOne({'_id': i}) for i in ids if i not in seen)
+    if op_buffer:
         new_collection.bulk_write(op_buffer)
-        op_buffer = []
 
-if op_buffer:
-    new_collection.bulk_write(op_buffer)
+def process_parquet(store_dir, months=None):
+    existing = list_months(store_dir, RAW_TABLE)
+    for year, month in existing if months is None else months:
+        if (year, month) not in existing:
+            path = partition_path(store_dir, PROCESSED_TABLE, year, month)
+            if os.path.exists(path):
+                os.remove(path)
+            continue
+        df = read_month(store_dir, RAW_TABLE, year, month)
+        df = df[df['研报文本'].notna() & (df['研报文本'] != '')].copy()
+        df['研报文本'] = df['研报文本'].map(lambda report: filter_report(report) or None)
+        write_month(store_dir, PROCESSED_TABLE, year, month, df)
+        print(f"{year}-{month} is done")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backend", choices=BACKENDS, default="mongo")
+    parser.add_argument("--store", default=STORE_DIR)
+    parser.add_argument("--touched", help="only process what 03 reported in this touched file")
+    parser.add_argument("--keep-touched", action="store_true",
+                        help="leave the processed entries in the touched file (by default they are removed)")
+    args = parser.parse_args()
+
+    ids, months = touched_scope(args.touched)
+    if args.backend == "parquet":
+        process_parquet(args.store, months)
+    else:
+        process_mongo(ids)
+    print("data processing II is done")
+    if not args.keep_touched:
+        consume_touched(args.touched, ids, months)
 
-print("data processing II is done")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -1,34 +1,36 @@
 # 6-pre-train-BERT.py
 # Jeff He @ Apr. 8
 
-import pandas as pd
+import numpy as np
 import tensorflow as tf
-from sklearn.model_selection import train_test_split
 from sklearn.metrics import accuracy_score, classification_report
-from transformers import BertTokenizer, TFBertForSequenceClassification
+from transformers import BertTokenizerFast, TFBertForSequenceClassification
+from token_store import TOKEN_DIR, open_token_store
+from training_data import csv_examples, store_examples, store_matches, make_dataset
 
 tf.config.threading.set_intra_op_parallelism_threads(6)
 tf.config.threading.set_inter_op_parallelism_threads(6)
 
 data_path = 'test_data.csv'
-df = pd.read_csv(data_path)
-texts = df['']
-labels = df[''].values
-
-train_texts, val_texts, train_labels, val_labels = train_test_split(texts, labels, test_size=0.2)
+max_length = 500
+batch_size = 8
 
 model_path = r'D:\Projects\bert'
 
-tokenizer = BertTokenizer.from_pretrained(model_path)
-
-def encode_texts(texts, tokenizer, max_length=500):
-    return tokenizer(texts.tolist(), padding=True, truncation=True, max_length=max_length, return_tensors="tf")
+tokenizer = BertTokenizerFast.from_pretrained(model_path)
 
-train_encodings = encode_texts(train_texts, tokenizer)
-val_encodings = encode_texts(val_texts, tokenizer)
+# examples stream in and are padded per length bucket instead of all to the longest one;
+# the token store from 19-tokenize-corpus.py --source training is used while it matches the csv
+token_store = open_token_store(TOKEN_DIR, "training", tokenizer, max_length)
+if store_matches(token_store, data_path):
+    train_examples = store_examples(token_store, False, max_length)
+    val_examples = store_examples(token_store, True, max_length)
+else:
+    train_examples = csv_examples(data_path, '标题', '正负面', tokenizer, max_length, False)
+    val_examples = csv_examples(data_path, '标题', '正负面', tokenizer, max_length, True)
 
-train_dataset = tf.data.Dataset.from_tensor_slices((dict(train_encodings), train_labels))
-val_dataset = tf.data.Dataset.from_tensor_slices((dict(val_encodings), val_labels))
+train_dataset = make_dataset(train_examples, batch_size, tokenizer.pad_token_id, shuffle=True)
+val_dataset = make_dataset(val_examples, batch_size, tokenizer.pad_token_id)
 
 model = TFBertForSequenceClassification.from_pretrained(model_path, num_labels=2)
 
@@ -37,14 +39,20 @@ loss = tf.keras.losses.SparseCategoricalCrossentropy(from_logits=True)
 metrics = ['accuracy']
 
 model.compile(optimizer=optimizer, loss=loss, metrics=metrics)
-history = model.fit(train_dataset.batch(8), epochs=5, validation_data=val_dataset.batch(8))
+history = model.fit(train_dataset, epochs=5, validation_data=val_dataset)
 model.save('trained_model')
 print("model saved")
 
-val_loss, val_accuracy = model.evaluate(val_dataset.batch(8))
+val_loss, val_accuracy = model.evaluate(val_dataset)
 print(f"validation loss: {val_loss}")
 print(f"validation accuracy: {val_accuracy}")
-val_preds = model.predict(val_dataset.batch(8)).logits
-predicted_labels = tf.argmax(val_preds, axis=1)
+# batches come out in bucket order, so labels are collected alongside the predictions
+val_labels = []
+predicted_labels = []
+for features, labels in val_dataset:
+    predicted_labels.append(tf.argmax(model(features, training=False).logits, axis=1).numpy())
+    val_labels.append(labels.numpy())
+val_labels = np.concatenate(val_labels)
+predicted_labels = np.concatenate(predicted_labels)
 print("accuracy:", accuracy_score(val_labels, predicted_labels))
-print(classification_report(val_labels, predicted_labels))
\ No newline at end of file
+print(classification_report(val_labels, predicted_labels))
@@ -1,52 +1,26 @@
 # 7-BERT-on-cpu.py
 # Jeff He @ Apr. 8
 
-import tensorflow as tf
-from transformers import BertTokenizer
-from pymongo import MongoClient
-import numpy as np
-
-mongo_cli = MongoClient('mongodb://localhost:27017/')
-source_db = mongo_cli['processed_stock_reports_db']
-source_collection = source_db['processed_reports']
-sentiment_db = mongo_cli['sentiment_analysis_v2_db']
-sentiment_collection = sentiment_db['sentence_predictions']
-
-tokenizer = BertTokenizer.from_pretrained(r'D:\Projects\bert')
-model = tf.saved_model.load(r'D:\Projects\report-analysis\trained_model')
-infer = model.signatures['serving_default']
+import argparse
+from report_store import BACKENDS, STORE_DIR, PROCESSED_TABLE, open_store
+from score_sinks import open_sink
+from scoring import (MAX_LENGTH, BATCH_SIZE, ENGINES, TOKENIZER_PATH, resolve_model, build_result,
+                     score_reports, load_tokenizer, load_predictor)
+from score_cache import SCORE_CACHE, open_score_cache
+from token_store import TOKEN_DIR, open_token_store
+from scoring_pipeline import QUEUE_DEPTH, run_pipeline
+from run_metrics import EXPORT_INTERVAL, METRICS_FILE, MetricsExporter, metrics
+
+tokenizer = load_tokenizer(fast=True)
+predict = None
 
 def process_report(report) -> dict:
-    if 'бı' not in report or not report['бı']:
+    if '研报文本' not in report or not report['研报文本']:
         return None
 
-    encodings = tokenizer(report['бı'], padding=True, truncation=True, max_length=500, return_tensors="tf")
-    encodings['token_type_ids'] = tf.zeros_like(encodings['input_ids'])
-
-    logits = infer(input_ids=encodings['input_ids'], attention_mask=encodings['attention_mask'], token_type_ids=encodings['token_type_ids'])['logits']
-    probs = tf.nn.softmax(logits, axis=-1).numpy()
-    predictions = np.argmax(probs, axis=1)
-    sentiment_docs = []
-    adjusted_total = 0.0
-
-    for i, text in enumerate(report['бı']):
-        raw_prob = float(probs[i][1])
-        adjusted_score = raw_prob - 0.5 
-        adjusted_total += adjusted_score
-        sentiment_doc = {
-            'Ʊ': report['Ʊ'],
-            '': report[''],
-            'б': report['б'],
-            'ԭʼı': text,
-            'Ԥ': '' if predictions[i] == 1 else '',
-            'ԭʼ': raw_prob,
-            '÷': adjusted_score,
-            'ĵID': report['_id']
-        }
-        sentiment_docs.append(sentiment_doc)
-
-    avg_score = adjusted_total / len(report['бı']) if report['бı'] else 0
-    return {'sentiment_docs': sentiment_docs, 'avg_score': avg_score}
+    encodings = tokenizer(report['研报文本'], padding=True, truncation=True, max_length=MAX_LENGTH, return_tensors="np")
+    probs = predict(encodings['input_ids'], encodings['attention_mask'])
+    return build_result(report, probs)
 
 def get_user_date_input(prompt):
     while True:
@@ -57,46 +31,112 @@ def get_user_date_input(prompt):
             print("wrong format")
 
 def main():
-    start_date = get_user_date_input("start:")
-    end_date = get_user_date_input("end:")
+    global predict
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backend", choices=BACKENDS, default="mongo")
+    parser.add_argument("--store", default=STORE_DIR)
+    parser.add_argument("--mode", choices=["pipelined", "bucketed", "per-report"], default="pipelined",
+                        help="bucketed pools sentences across reports into length-sorted batches, "
+                             "pipelined does the same with reading, tokenizing and writing overlapped")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--pool-sentences", type=int, default=4096,
+                        help="sentences collected across reports before they are sorted and scored")
+    parser.add_argument("--tokenizer-threads", type=int, default=2)
+    parser.add_argument("--queue-depth", type=int, default=QUEUE_DEPTH, help="pools held between pipeline stages")
+    parser.add_argument("--tokens", default=TOKEN_DIR, help="token store written by 19, used when present")
+    parser.add_argument("--cache", default=SCORE_CACHE, help="sentence score cache, empty string to disable")
+    parser.add_argument("--engine", choices=ENGINES, default="tf",
+                        help="onnx runs the int8 graph written by 20-export-onnx.py")
+    parser.add_argument("--model", help="model path or teacher/student, defaults to the engine's usual one")
+    parser.add_argument("--metrics", default=METRICS_FILE,
+                        help="stage timings, .prom for Prometheus text, else JSONL; empty string to disable")
+    parser.add_argument("--metrics-interval", type=int, default=EXPORT_INTERVAL, help="seconds between exports")
+    parser.add_argument("--start", help="YYYY-MM-DD, asked for when omitted")
+    parser.add_argument("--end", help="YYYY-MM-DD, asked for when omitted")
+    args = parser.parse_args()
+
+    start_date = args.start or get_user_date_input("start:")
+    end_date = args.end or get_user_date_input("end:")
 
     if end_date < start_date:
         print("wrong input")
         return
 
-    query = {"": {"$gte": start_date, "$lte": end_date}}
-    cursor = source_collection.find(query).sort("", 1)
+    model_path = resolve_model(args.engine, args.model)
+    predict = load_predictor(model_path, args.engine)
+    source = open_store(args.backend, PROCESSED_TABLE, args.store)
+    sink = open_sink(args.backend, args.store)
+    token_store = open_token_store(args.tokens, "processed", tokenizer, MAX_LENGTH)
+    cache = open_score_cache(args.cache, model_path, TOKENIZER_PATH, MAX_LENGTH)
+    cursor = source.find(start_date, end_date, sort=True)
+    metrics.set_total(source.count(start_date, end_date))
 
     processed_dates = set()
     total_processed = 0
     current_date = None
     counter = 0
-
-    for report in cursor:
-        try:
-            if current_date is not None and report[''] != current_date:
+    pool = []
+    pooled = 0
+
+    def score_pool(reports):
+        if args.mode == "bucketed":
+            try:
+                return score_reports(reports, tokenizer, predict, args.batch_size, MAX_LENGTH, token_store, cache)
+            except Exception as e:
+                # fall back to one report at a time to isolate the one that broke the batch
+                print(f'pooled scoring failed ({str(e)}), retrying report by report')
+        results = []
+        for report in reports:
+            try:
+                results.append((report, process_report(report)))
+            except Exception as e:
+                print(f'error when processing {report.get("_id", report.get("报告链接"))}:{str(e)}')
+        return results
+
+    def write_results(results):
+        nonlocal total_processed, current_date, counter
+        for report, result in results:
+            if current_date is not None and report['发布日期'] != current_date:
                 print(f"day counter :  {current_date}, paper counter : {counter}, total counter : {len(processed_dates)}")
                 counter = 0
-            current_date = report['']
-            result = process_report(report)
-            
+            current_date = report['发布日期']
             if not result:
                 continue
-            if result['sentiment_docs']:
-                sentiment_collection.insert_many(result['sentiment_docs'])
-            source_collection.update_one({'_id': report['_id']}, {'$set': {'ۺϵ÷': result['avg_score']}})
+            try:
+                sink.write(report, result)
+            except Exception as e:
+                print(f'error when processing {report.get("_id", report.get("报告链接"))}:{str(e)}')
+                continue
             processed_dates.add(current_date)
             counter += 1
             total_processed += 1
-            
-        except Exception as e:
-            print(f'error when processing {report.get("_id")}:{str(e)}')
-            continue
+            metrics.progress()
+
+    with MetricsExporter(args.metrics, args.metrics_interval):
+        try:
+            if args.mode == "pipelined":
+                stats = run_pipeline(cursor, tokenizer, predict, write_results, args.batch_size, MAX_LENGTH,
+                                     args.pool_sentences, token_store, cache, args.tokenizer_threads,
+                                     args.queue_depth)
+                print(f"pipeline : {stats}")
+            else:
+                for report in metrics.timed_iter(cursor, "fetch"):
+                    pool.append(report)
+                    pooled += len(report.get('研报文本') or [])
+                    if args.mode == "per-report" or pooled >= args.pool_sentences:
+                        write_results(score_pool(pool))
+                        pool = []
+                        pooled = 0
+                write_results(score_pool(pool))
+        finally:
+            sink.flush()
 
     if current_date is not None:
         print(f"day counter :  {current_date}, paper counter : {counter}, total counter : {len(processed_dates)}")
 
     print(f"day counter : {len(processed_dates)} , paper counter : {total_processed}")
+    if cache is not None:
+        print(f"score cache : {cache.stats()}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,41 +1,27 @@
 # 8-factor-visualize.py
 # Jeff He @ Apr. 8
 
-import pymongo
-import pandas as pd
+import argparse
 from datetime import datetime
 import warnings
 warnings.filterwarnings("ignore",category=Warning)
 
-mongo_cli = pymongo.MongoClient("mongodb://localhost:27017/")
-db = mongo_cli["processed_stock_reports_db"]
-collection = db["processed_reports"]
-start_date = str(datetime(2008, 1, 1))
-end_date = str(datetime(2008, 9, 27))
-
-query = {"": {"$gte": start_date, "$lte": end_date}}
-reports = collection.find(query)
-stock_data = {}
+from report_store import BACKENDS, REDUCERS, STORE_DIR, PROCESSED_TABLE, open_store
+from score_panel import load_panel
+from factor_panel import SCORE_PANEL, save_factor_panel
 
-for report in reports:
-    code = report['Ʊ']
-    report_date = report['']
-    score = report['ۺϵ÷']
+parser = argparse.ArgumentParser()
+parser.add_argument("--backend", choices=BACKENDS, default="mongo")
+parser.add_argument("--store", default=STORE_DIR)
+parser.add_argument("--reducer", choices=REDUCERS, default="mean", help="for several reports of a stock on one date")
+parser.add_argument("--output", default=SCORE_PANEL, help="panel directory, see 27-export-panel.py for xlsx")
+args = parser.parse_args()
 
-    if code not in stock_data:
-        stock_data[code] = {}
-    date_str = report_date
-    stock_data[code][date_str] = score
-
-all_time = sorted(set(date for data in stock_data.values() for date in data.keys()))
-df = pd.DataFrame(columns=['Ʊ'] + all_time)
-rows = []
+collection = open_store(args.backend, PROCESSED_TABLE, args.store)
+start_date = str(datetime(2008, 1, 1))
+end_date = str(datetime(2008, 9, 27))
 
-for code, data in stock_data.items():
-    row = {'Ʊ': code}
-    for date in all_time:
-        row[date] = data.get(date, 0)
-    rows.append(row)
-df = pd.concat([df, pd.DataFrame(rows)], ignore_index=True)
-df.to_excel("stock_scores.xlsx", index=False)
+# only the reported (stock, date) cells are held and written
+panel = load_panel(collection, start_date, end_date, args.reducer)
+save_factor_panel(panel, args.output)
 print("done")
\ No newline at end of file
@@ -1,72 +1,36 @@
 # 9-pivot-out.py
 # Jeff He @ Apr. 8
 
-import pymongo
-import pandas as pd
+import argparse
 from datetime import datetime
 
-mongo_cli = pymongo.MongoClient("mongodb://localhost:27017/")
-db = mongo_cli["processed_stock_reports_db"]
-collection = db["processed_reports"]
+from report_store import BACKENDS, REDUCERS, STORE_DIR, PROCESSED_TABLE, open_store
+from factor_engine import HALFLIFE, SCHEMES, WINDOW, decay_weights, decayed_panel
+from score_panel import load_panel
+from factor_panel import FACTOR_PANEL, save_factor_panel
 
-start_date = str(datetime(2008, 1, 1))
-end_date = str(datetime(2008, 9, 27))
-
-query = {"": {"$gte": start_date, "$lte": end_date}}
-reports = collection.find(query)
-data = {}
-
-for report in reports:
-    code = report['Ʊ']
-    date = report['']
-    score = report['ۺϵ÷']
-    if code not in data:
-        data[code] = {}
-
-    date_str = date
-    data[code][date_str] = score
+parser = argparse.ArgumentParser()
+parser.add_argument("--backend", choices=BACKENDS, default="mongo")
+parser.add_argument("--store", default=STORE_DIR)
+parser.add_argument("--reducer", choices=REDUCERS, default="mean", help="for several reports of a stock on one date")
+parser.add_argument("--window", type=int, default=WINDOW, help="report dates in the decay window")
+parser.add_argument("--weights", choices=SCHEMES, default="reciprocal")
+parser.add_argument("--halflife", type=float, default=HALFLIFE, help="for --weights exponential")
+parser.add_argument("--output", default=FACTOR_PANEL, help="panel directory read by 11/14")
+args = parser.parse_args()
 
-all_time = sorted(set(date for data in data.values() for date in data.keys()))
-df = pd.DataFrame(columns=['Ʊ'] + all_time)
-rows = []
+collection = open_store(args.backend, PROCESSED_TABLE, args.store)
 
-for stock_code, data in data.items():
-    row = {'Ʊ': stock_code}
-    for date in all_time:
-        row[date] = data.get(date, 0)
-    rows.append(row)
-df = pd.concat([df, pd.DataFrame(rows)], ignore_index=True)
-weights = [1/(90-i) for i in range(90)]
-
-def calculate_weighted_score(row, start_index, weights):
-    weighted = 0
-    total_weight = 0
-    for i in range(90):
-        index = start_index - i
-        if index < 1:
-            score = 0
-        else:
-            date = row.index[index]
-            score = row[date]
-        
-        weight = weights[i]
-        weighted += score * weight
-        total_weight += weight
-    
-    return weighted / total_weight if total_weight != 0 else 0
-
-results = []
-
-for index, row in df.iterrows():
-    if pd.isna(row['Ʊ']):
-        continue
+start_date = str(datetime(2008, 1, 1))
+end_date = str(datetime(2008, 9, 27))
 
-    for start_index in range(1, len(row)):
-        score = calculate_weighted_score(row, start_index, weights)
-        results.append({'Ʊ': row['Ʊ'], 'Date': row.index[start_index], 'Score': score})
+# sparse stock x date panel straight from the (股票代码, 发布日期, 综合得分) triples
+panel = load_panel(collection, start_date, end_date, args.reducer)
 
-result_df = pd.DataFrame(results)
-pivot_df = result_df.pivot(index='Date', columns='Ʊ', values='Score')
+# one vectorized pass over the panel, see factor_engine.py
+weights = decay_weights(args.window, args.weights, args.halflife)
+factor = decayed_panel(panel, weights)
 
-pivot_df.to_excel("pivoted.xlsx")
+# binary panel for 11/14; 27-export-panel.py turns it into the old pivoted.xlsx
+save_factor_panel(factor, args.output)
 print("Done")
\ No newline at end of file
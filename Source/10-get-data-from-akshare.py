@@ -1,16 +1,15 @@
 # 10-get-data-from-akshare.py
 # Jeff He @ Apr. 8
 
-import akshare as ak
-from pymongo import MongoClient
+import argparse
+import os
+import time
+from report_store import BACKENDS, STORE_DIR, PROCESSED_TABLE, open_store
+from market_data import MARKET_DIR, PERIODS, RATE, SOURCES, WORKERS, MarketData, open_source
 
-def get_stock_codes_from_mongodb():
-    mongo_cli = MongoClient('mongodb://localhost:27017/')
-    db = mongo_cli['processed_stock_reports_db']
-    collection = db['processed_reports']
-    query = {"": {"$gte": "2008-01-01", "$lte": "2008-09-23"}}
-
-    raw = collection.distinct("Ʊ", query)
+def get_stock_codes(backend="mongo", store_dir=STORE_DIR):
+    collection = open_store(backend, PROCESSED_TABLE, store_dir)
+    raw = collection.distinct("股票代码", "2008-01-01", "2008-09-23")
     processed = []
     for code in raw:
         try:
@@ -20,32 +19,56 @@ def get_stock_codes_from_mongodb():
             print(f"error in code : {code}")
     unique = list(set(processed))
     
-    mongo_cli.close()
     print(f"{len(unique)} found")
     return unique
 
-def get_stock_history_data(stock_code):
+def get_stock_history_data(market, stock_code, start_date, end_date, period):
+    # read back from the cache refresh() just filled; history() would fetch the unsettled
+    # tail of the range a second time
     try:
-        df = ak.stock_zh_a_hist(symbol=stock_code, period="monthly", start_date="20080101", end_date="20191231", adjust="") # Change argument "period" for daily data
-        df = df[['', '', 'ǵ']]
-        df.insert(0, 'Ʊ', stock_code)
+        df = market.cached_range(stock_code, start_date, end_date, period).reset_index()
+        df = df[['日期', '收盘', '涨跌幅']]
+        df['日期'] = df['日期'].dt.strftime('%Y-%m-%d')
+        df.insert(0, '股票代码', stock_code)
         return df
     except Exception as e:
         print(f"failed in {stock_code} : {str(e)}")
         return None
 
-def save_to_csv(dataframe, stock_code):
+def save_to_csv(dataframe, stock_code, output_dir="."):
     if dataframe is not None and not dataframe.empty:
-        filename = f"{stock_code}_2008_history.csv"
+        filename = os.path.join(output_dir, f"{stock_code}_2008_history.csv")
         dataframe.to_csv(filename, index=False)
         print(f"saved {filename} ({len(dataframe)})")
 
 def main():
-    processed_code = get_stock_codes_from_mongodb()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backend", choices=BACKENDS, default="mongo")
+    parser.add_argument("--store", default=STORE_DIR)
+    parser.add_argument("--start", default="2008-01-01")
+    parser.add_argument("--end", default="2019-12-31")
+    parser.add_argument("--period", choices=PERIODS, default="monthly")
+    parser.add_argument("--market-data", default=MARKET_DIR, help="local price cache, only missing ranges are fetched")
+    parser.add_argument("--source", choices=list(SOURCES), default="akshare")
+    parser.add_argument("--source-dir", help="for --source csv: <dir>/<period>/<code>.csv")
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--rate", type=float, default=RATE, help="requests per second across all workers")
+    parser.add_argument("--output", default=".", help="where the per-stock csvs for 11/14 go")
+    args = parser.parse_args()
+
+    processed_code = get_stock_codes(args.backend, args.store)
+    market = MarketData(args.market_data, open_source(args.source, args.source_dir), args.workers, args.rate)
+    begin = time.time()
+    fetched = market.refresh(processed_code, args.start, args.end, args.period)
+    requests = sum(n for n in fetched.values() if isinstance(n, int))
+    print(f"{requests} requests for {len(processed_code)} stocks in {time.time() - begin:.1f}s")
+    os.makedirs(args.output, exist_ok=True)
     for code in processed_code:
-        history_data = get_stock_history_data(code)
+        if isinstance(fetched.get(code), Exception):
+            continue
+        history_data = get_stock_history_data(market, code, args.start, args.end, args.period)
         if history_data is not None:
-            save_to_csv(history_data, code)
+            save_to_csv(history_data, code, args.output)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,53 @@
+# 15-export-parquet.py
+# Copies the MongoDB collections into the partitioned Parquet store (see report_store.py),
+# after which 03-10 can run with --backend parquet on machines without mongod.
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from report_store import (STORE_DIR, RAW_TABLE, PROCESSED_TABLE, SENTENCE_TABLE,
+                          open_store, months_between, write_month)
+
+def date_bounds(collection):
+    first = collection.find({}, {"发布日期": 1}).sort("发布日期", 1).limit(1)
+    last = collection.find({}, {"发布日期": 1}).sort("发布日期", -1).limit(1)
+    first, last = list(first), list(last)
+    if not first:
+        return None, None
+    return first[0]["发布日期"], last[0]["发布日期"]
+
+def export_month(source, store_dir, table, year, month):
+    df = source.frame(f"{year}-{month}-01", f"{year}-{month}-31")
+    if df.empty:
+        return 0
+    if "关联文档ID" in df.columns:
+        df["关联文档ID"] = df["关联文档ID"].astype(str)
+    if "研报文本" in df.columns and table == PROCESSED_TABLE:
+        df["研报文本"] = df["研报文本"].map(lambda x: x if isinstance(x, list) else None)
+    return write_month(store_dir, table, year, month, df)
+
+def export_table(table, store_dir, workers):
+    source = open_store("mongo", table)
+    start_date, end_date = date_bounds(source.collection)
+    if start_date is None:
+        print(f"{table} is empty")
+        return
+    months = months_between(start_date[:10], end_date[:10])
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        counts = pool.map(lambda m: export_month(source, store_dir, table, *m), months)
+        for (year, month), count in zip(months, counts):
+            if count:
+                print(f"{table} {year}-{month} : {count}")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--store", default=STORE_DIR)
+    parser.add_argument("--tables", nargs="+", default=[RAW_TABLE, PROCESSED_TABLE, SENTENCE_TABLE])
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    for table in args.tables:
+        export_table(table, args.store, args.workers)
+    print("done")
+
+if __name__ == "__main__":
+    main()
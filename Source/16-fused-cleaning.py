@@ -0,0 +1,120 @@
+# 16-fused-cleaning.py
+# Single-pass replacement for 04 + 05. Every raw report is read once, cleaned, split and
+# filtered, then written straight to processed_reports; the raw collection stays as crawled.
+# Work is split by month (or by chunks of touched _ids) across a process pool.
+
+import os
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import pyarrow as pa
+import pymongo
+from text_cleaning import clean_reports
+from report_store import (BACKENDS, STORE_DIR, RAW_TABLE, PROCESSED_TABLE, MONGO_URI, MONGO_COLLECTIONS,
+                          list_months, read_month, write_month, partition_path, find_by_ids, touched_scope,
+                          consume_touched)
+
+BATCH_SIZE = 1000
+
+_collections = None
+
+def get_collections():
+    global _collections
+    if _collections is None:
+        client = pymongo.MongoClient(MONGO_URI)
+        _collections = tuple(client[db][name] for db, name in
+                             (MONGO_COLLECTIONS[RAW_TABLE], MONGO_COLLECTIONS[PROCESSED_TABLE]))
+    return _collections
+
+def to_operation(doc, sentences):
+    if sentences is None:
+        return pymongo.DeleteOne({'_id': doc['_id']})
+    new_doc = doc.copy()
+    if sentences:
+        new_doc['研报文本'] = sentences
+    else:
+        new_doc.pop('研报文本', None)
+    return pymongo.ReplaceOne({'_id': doc['_id']}, new_doc, upsert=True)
+
+def flush(collection, batch, extra=()):
+    # one vectorized cleaning call per write batch
+    cleaned = clean_reports([doc.get('研报文本') for doc in batch])
+    ops = [to_operation(doc, sentences) for doc, sentences in zip(batch, cleaned)]
+    ops.extend(extra)
+    if ops:
+        collection.bulk_write(ops, ordered=False)
+    return len(ops)
+
+def write_operations(docs, ids=None):
+    _, processed = get_collections()
+    batch = []
+    seen = set()
+    count = 0
+    for doc in docs:
+        seen.add(doc['_id'])
+        batch.append(doc)
+        if len(batch) >= BATCH_SIZE:
+            count += flush(processed, batch)
+            batch = []
+    missing = [] if ids is None else [pymongo.DeleteOne({'_id': i}) for i in ids if i not in seen]
+    return count + flush(processed, batch, missing)
+
+def clean_month_mongo(year, month):
+    raw, _ = get_collections()
+    return f"{year}-{month}", write_operations(raw.find({'年份': year, '月份': month}))
+
+def clean_ids_mongo(ids):
+    raw, _ = get_collections()
+    return f"{len(ids)} ids", write_operations(find_by_ids(raw, ids), ids)
+
+def clean_month_parquet(store_dir, year, month):
+    if not os.path.exists(partition_path(store_dir, RAW_TABLE, year, month)):
+        path = partition_path(store_dir, PROCESSED_TABLE, year, month)
+        if os.path.exists(path):
+            os.remove(path)
+        return f"{year}-{month}", 0
+    df = read_month(store_dir, RAW_TABLE, year, month)
+    cleaned = clean_reports(pa.array(df['研报文本'], pa.string()))
+    df['研报文本'] = [sentences or None for sentences in cleaned]
+    df = df[[sentences is not None for sentences in cleaned]].copy()
+    return f"{year}-{month}", write_month(store_dir, PROCESSED_TABLE, year, month, df)
+
+def mongo_months():
+    client = pymongo.MongoClient(MONGO_URI)
+    db_name, collection_name = MONGO_COLLECTIONS[RAW_TABLE]
+    groups = client[db_name][collection_name].aggregate([{'$group': {'_id': {'y': '$年份', 'm': '$月份'}}}])
+    months = sorted((g['_id']['y'], g['_id']['m']) for g in groups)
+    client.close()
+    return months
+
+def main():
+    parser = argparse.ArgumentParser(description="fused clean + split stage, raw reports -> processed reports")
+    parser.add_argument("--backend", choices=BACKENDS, default="mongo")
+    parser.add_argument("--store", default=STORE_DIR)
+    parser.add_argument("--touched", help="only process what 03 reported in this touched file")
+    parser.add_argument("--keep-touched", action="store_true",
+                        help="leave the processed entries in the touched file (by default they are removed)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    ids, months = touched_scope(args.touched)
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        if args.backend == "parquet":
+            months = months if months is not None else list_months(args.store, RAW_TABLE)
+            futures = [pool.submit(clean_month_parquet, args.store, y, m) for y, m in months]
+        elif ids is not None:
+            step = max(len(ids) // (args.workers * 4), BATCH_SIZE)
+            futures = [pool.submit(clean_ids_mongo, ids[i:i + step]) for i in range(0, len(ids), step)]
+        else:
+            futures = [pool.submit(clean_month_mongo, y, m) for y, m in mongo_months()]
+        total = 0
+        for future in as_completed(futures):
+            part, count = future.result()
+            total += count
+            print(f"{part} is done ({count})")
+
+    print(f"data processing is done, {total} documents")
+    if not args.keep_touched:
+        consume_touched(args.touched, ids, months)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+# 17-cleaning-golden-check.py
+# Golden check for the batch cleaning kernels: runs the per-string rules (clean_report) and
+# the vectorized kernels (clean_reports) over the same report texts, requires identical
+# output and reports the throughput of both in reports/sec.
+
+import os
+import sys
+import time
+import argparse
+import pandas as pd
+import pyarrow as pa
+from corpus_io import REPORT_DIR, REPORT_COLUMNS, list_month_files
+from text_cleaning import clean_report, clean_reports, clean_batch
+
+def load_texts(path):
+    texts = []
+    for file_name in list_month_files(path):
+        try:
+            df = pd.read_csv(os.path.join(path, file_name), usecols=REPORT_COLUMNS, dtype=str, encoding="utf-8-sig")
+        except (UnicodeDecodeError, pd.errors.ParserError) as e:
+            print(f"skipped {file_name}: {e}")
+            continue
+        texts.extend(df["研报文本"].tolist())
+    return texts
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--path", default=REPORT_DIR)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    texts = load_texts(args.path)
+    column = pa.array(texts, pa.string())
+    expected, scalar_time = timed(lambda: [clean_report(text) for text in texts])
+    actual, batch_time = timed(lambda: clean_reports(column, args.workers))
+    _, kernel_time = timed(lambda: clean_batch(column, args.workers))
+
+    mismatches = [i for i, (a, b) in enumerate(zip(expected, actual)) if a != b]
+    print(f"reports           : {len(texts)}")
+    print(f"per-string        : {len(texts) / scalar_time:,.0f} reports/sec")
+    print(f"batch ({args.workers} threads) : {len(texts) / batch_time:,.0f} reports/sec")
+    print(f"  kernels only    : {len(texts) / kernel_time:,.0f} reports/sec (flat sentences, no per-report lists)")
+    print(f"mismatches        : {len(mismatches)}")
+    for i in mismatches[:5]:
+        print(f"  report {i}:\n    expected {expected[i]}\n    actual   {actual[i]}")
+    sys.exit(1 if mismatches or len(expected) != len(actual) else 0)
+
+if __name__ == "__main__":
+    main()
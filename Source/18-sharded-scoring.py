@@ -0,0 +1,197 @@
+# 18-sharded-scoring.py
+# Non-interactive, resumable 07: the date range is cut into shards that a pool of worker
+# processes scores in parallel. Each worker loads the tokenizer and model once with its own
+# intra-op thread budget. Finished shards go into a checkpoint file and reports that already
+# carry a 综合得分 are skipped, so a restarted run picks up where the last one stopped.
+
+import argparse
+import json
+import multiprocessing as mp
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import pandas as pd
+from corpus_io import write_json_atomic
+from report_store import BACKENDS, STORE_DIR, PROCESSED_TABLE, open_store
+from score_sinks import open_sink
+from scoring import (MAX_LENGTH, BATCH_SIZE, ENGINES, TOKENIZER_PATH, resolve_model, configure_threads,
+                     load_tokenizer, load_predictor)
+from scoring_pipeline import run_pipeline
+from run_metrics import EXPORT_INTERVAL, METRICS_FILE, MetricsExporter, metrics
+from token_store import TOKEN_DIR, open_token_store
+from score_cache import SCORE_CACHE, open_score_cache
+
+CHECKPOINT_FILE = "scoring_checkpoint.json"
+
+worker = {}
+
+
+def date_shards(start_date, end_date, shard_days, by_month):
+    # the parquet sink rewrites whole month partitions, so there every shard is one month
+    # and no two workers ever write the same file
+    start, end = pd.Timestamp(start_date), pd.Timestamp(end_date)
+    if by_month:
+        edges = [start] + list(pd.date_range(start + pd.offsets.MonthBegin(1), end, freq="MS"))
+    else:
+        edges = list(pd.date_range(start, end, freq=f"{shard_days}D"))
+    ends = [edge - pd.Timedelta(days=1) for edge in edges[1:]] + [end]
+    return [(first.strftime("%Y-%m-%d"), last.strftime("%Y-%m-%d")) for first, last in zip(edges, ends)]
+
+
+def shard_key(shard):
+    return f"{shard[0]}~{shard[1]}"
+
+
+def load_checkpoint(checkpoint_path):
+    if not os.path.exists(checkpoint_path):
+        return {"shards": {}}
+    with open(checkpoint_path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def init_worker(options, core_groups):
+    if core_groups is not None and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, core_groups.get())
+    if options["engine"] == "tf":
+        configure_threads(options["intra_threads"], options["inter_threads"])
+    worker["options"] = options
+    worker["tokenizer"] = load_tokenizer(options["tokenizer"], fast=True)
+    worker["predict"] = load_predictor(options["model"], options["engine"], options["intra_threads"])
+    worker["token_store"] = open_token_store(options["tokens"], "processed", worker["tokenizer"], MAX_LENGTH)
+    worker["cache"] = open_score_cache(options["cache"], options["model"], options["tokenizer"], MAX_LENGTH)
+    worker["source"] = open_store(options["backend"], PROCESSED_TABLE, options["store"])
+    if options["metrics"]:
+        # one file per worker, named after its pid
+        root, ext = os.path.splitext(options["metrics"])
+        worker["metrics"] = f"{root}.{os.getpid()}{ext}"
+
+
+def score_shard(shard):
+    options = worker["options"]
+    tokenizer, predict, token_store = worker["tokenizer"], worker["predict"], worker["token_store"]
+    cache = worker["cache"]
+    cached = cache.stats() if cache is not None else None
+    sink = open_sink(options["backend"], options["store"])
+    begin = time.time()
+    skipped = 0
+
+    def unscored():
+        nonlocal skipped
+        for report in worker["source"].find(shard[0], shard[1], sort=True):
+            if not options["rescore"] and report.get("综合得分") is not None:
+                skipped += 1
+                continue
+            yield report
+
+    def write(results):
+        for report, result in results:
+            sink.write(report, result)
+        metrics.progress(len(results))
+
+    # exports every interval while the shard runs and once more when it ends; the registry is
+    # per process, so each snapshot still covers every shard this worker has scored
+    with MetricsExporter(worker.get("metrics"), options["metrics_interval"]):
+        try:
+            pipeline = run_pipeline(unscored(), tokenizer, predict, write, options["batch_size"], MAX_LENGTH,
+                                    options["pool_sentences"], token_store, cache, options["tokenizer_threads"])
+        finally:
+            sink.flush()
+    scored, failed = pipeline["reports"], pipeline["failed"]
+    stats = {"scored": scored, "skipped": skipped, "failed": failed, "seconds": round(time.time() - begin, 1)}
+    if cache is not None:
+        now = cache.stats()
+        stats["cache_hits"] = now["memory_hits"] + now["disk_hits"] - cached["memory_hits"] - cached["disk_hits"]
+        stats["cache_misses"] = now["misses"] - cached["misses"]
+    return stats
+
+
+def core_groups_for(ctx, workers, threads):
+    cores = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else []
+    if len(cores) < workers * threads:
+        return None
+    groups = ctx.Queue()
+    for i in range(workers):
+        groups.put(set(cores[i * threads:(i + 1) * threads]))
+    return groups
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--start", required=True, help="YYYY-MM-DD")
+    parser.add_argument("--end", required=True, help="YYYY-MM-DD")
+    parser.add_argument("--backend", choices=BACKENDS, default="mongo")
+    parser.add_argument("--store", default=STORE_DIR)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--intra-threads", type=int, default=None,
+                        help="intra-op threads per worker, defaults to cores / workers")
+    parser.add_argument("--inter-threads", type=int, default=1)
+    parser.add_argument("--pin", action="store_true", help="pin each worker to its own block of cores")
+    parser.add_argument("--shard-days", type=int, default=7, help="shard width for the mongo backend")
+    parser.add_argument("--checkpoint", default=CHECKPOINT_FILE)
+    parser.add_argument("--rescore", action="store_true",
+                        help="ignore the checkpoint and existing 综合得分 and score everything again")
+    parser.add_argument("--engine", choices=ENGINES, default="tf")
+    parser.add_argument("--model", help="model path or teacher/student, defaults to the engine's usual one")
+    parser.add_argument("--tokenizer", default=TOKENIZER_PATH)
+    parser.add_argument("--tokens", default=TOKEN_DIR, help="token store written by 19, used when present")
+    parser.add_argument("--cache", default=SCORE_CACHE, help="sentence score cache, empty string to disable")
+    parser.add_argument("--metrics", default=METRICS_FILE,
+                        help="per-worker stage timings, .prom for Prometheus text, else JSONL; empty to disable")
+    parser.add_argument("--metrics-interval", type=int, default=EXPORT_INTERVAL)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--pool-sentences", type=int, default=4096)
+    parser.add_argument("--tokenizer-threads", type=int, default=2, help="per worker")
+    args = parser.parse_args()
+
+    if args.end < args.start:
+        print("wrong input")
+        return
+
+    intra_threads = args.intra_threads or max(1, (os.cpu_count() or 1) // args.workers)
+    options = {
+        "backend": args.backend, "store": args.store, "tokenizer": args.tokenizer,
+        "engine": args.engine, "model": resolve_model(args.engine, args.model),
+        "tokens": args.tokens, "cache": args.cache,
+        "intra_threads": intra_threads, "inter_threads": args.inter_threads, "rescore": args.rescore,
+        "batch_size": args.batch_size, "pool_sentences": args.pool_sentences,
+        "tokenizer_threads": args.tokenizer_threads,
+        "metrics": args.metrics, "metrics_interval": args.metrics_interval,
+    }
+
+    checkpoint = {"shards": {}} if args.rescore else load_checkpoint(args.checkpoint)
+    shards = date_shards(args.start, args.end, args.shard_days, args.backend == "parquet")
+    pending = [shard for shard in shards if shard_key(shard) not in checkpoint["shards"]]
+    print(f"{len(shards)} shards, {len(shards) - len(pending)} already done, "
+          f"{args.workers} workers x {intra_threads} threads")
+
+    # tensorflow does not survive fork, every worker starts from a fresh interpreter
+    ctx = mp.get_context("spawn")
+    core_groups = core_groups_for(ctx, args.workers, intra_threads) if args.pin else None
+    total = hits = misses = 0
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=ctx,
+                             initializer=init_worker, initargs=(options, core_groups)) as executor:
+        futures = {executor.submit(score_shard, shard): shard for shard in pending}
+        for future in as_completed(futures):
+            shard = futures[future]
+            try:
+                stats = future.result()
+            except Exception as e:
+                print(f"{shard_key(shard)} failed : {str(e)}")
+                continue
+            # a shard with failed reports stays pending so the next run retries them
+            if not stats["failed"]:
+                checkpoint["shards"][shard_key(shard)] = stats
+                write_json_atomic(checkpoint, args.checkpoint)
+            total += stats["scored"]
+            hits += stats.get("cache_hits", 0)
+            misses += stats.get("cache_misses", 0)
+            print(f"{shard_key(shard)} : scored {stats['scored']}, skipped {stats['skipped']}, "
+                  f"failed {stats['failed']}, {stats['seconds']}s")
+
+    print(f"paper counter : {total}, shards done : {len(checkpoint['shards'])}/{len(shards)}")
+    if hits + misses:
+        print(f"score cache : {hits} hits, {misses} misses, hit rate {hits / (hits + misses):.2%}")
+
+
+if __name__ == "__main__":
+    main()
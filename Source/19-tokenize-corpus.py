@@ -0,0 +1,85 @@
+# 19-tokenize-corpus.py
+# Tokenizes the processed corpus (for 07/18) or the labelled training csv (for 06) once,
+# with the fast tokenizer, into a memory-mapped token store (see token_store.py).
+# Rerun it after 05/16 has changed the corpus; reports whose text changed since the store
+# was built are simply tokenized again at scoring time.
+
+import argparse
+import os
+import time
+import pandas as pd
+from corpus_io import file_sha256
+from report_store import BACKENDS, STORE_DIR, PROCESSED_TABLE, open_store
+from scoring import MAX_LENGTH, TOKENIZER_PATH, load_tokenizer
+from token_store import TOKEN_DIR, TokenStoreWriter, report_key, store_path
+
+CHUNK_REPORTS = 2000
+
+
+def tokenize_chunk(writer, tokenizer, chunk, max_length, labels=None):
+    sentences = [s for report in chunk for s in report['研报文本']]
+    token_ids = tokenizer(sentences, truncation=True, max_length=max_length)['input_ids'] if sentences else []
+    position = 0
+    for i, report in enumerate(chunk):
+        count = len(report['研报文本'])
+        writer.add(report_key(report), report['研报文本'], token_ids[position:position + count],
+                   None if labels is None else labels[i])
+        position += count
+
+
+def tokenize_corpus(writer, tokenizer, source, max_length):
+    chunk = []
+    total = 0
+    for report in source.find(columns=['报告链接', '研报文本']):
+        if not report.get('研报文本'):
+            continue
+        chunk.append(report)
+        if len(chunk) >= CHUNK_REPORTS:
+            tokenize_chunk(writer, tokenizer, chunk, max_length)
+            total += len(chunk)
+            chunk = []
+            print(f"{total} reports tokenized")
+    tokenize_chunk(writer, tokenizer, chunk, max_length)
+
+
+def tokenize_training(writer, tokenizer, data_path, text_column, label_column, max_length):
+    # one "report" per row, keyed by its row number, with the label kept alongside
+    start = 0
+    for part in pd.read_csv(data_path, usecols=[text_column, label_column], chunksize=CHUNK_REPORTS):
+        chunk = [{'_id': start + i, '研报文本': [str(text)]} for i, text in enumerate(part[text_column])]
+        tokenize_chunk(writer, tokenizer, chunk, max_length, part[label_column].tolist())
+        start += len(part)
+    # 06 only trusts the store while the csv is unchanged
+    writer.meta.update(source_size=os.path.getsize(data_path), source_mtime=os.path.getmtime(data_path),
+                       source_sha256=file_sha256(data_path))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--source", choices=["corpus", "training"], default="corpus")
+    parser.add_argument("--backend", choices=BACKENDS, default="mongo")
+    parser.add_argument("--store", default=STORE_DIR)
+    parser.add_argument("--data", default="test_data.csv", help="labelled csv used by 06")
+    parser.add_argument("--text-column", default="标题")
+    parser.add_argument("--label-column", default="正负面")
+    parser.add_argument("--tokens", default=TOKEN_DIR)
+    parser.add_argument("--tokenizer", default=TOKENIZER_PATH)
+    parser.add_argument("--max-length", type=int, default=MAX_LENGTH)
+    args = parser.parse_args()
+
+    begin = time.time()
+    tokenizer = load_tokenizer(args.tokenizer, fast=True)
+    name = "processed" if args.source == "corpus" else "training"
+    writer = TokenStoreWriter(store_path(args.tokens, name, tokenizer, args.max_length), tokenizer, args.max_length)
+    if args.source == "corpus":
+        tokenize_corpus(writer, tokenizer, open_store(args.backend, PROCESSED_TABLE, args.store), args.max_length)
+    else:
+        tokenize_training(writer, tokenizer, args.data, args.text_column, args.label_column, args.max_length)
+    meta = writer.close()
+
+    print(f"{meta['reports']} reports, {meta['sentences']} sentences, {meta['tokens']} tokens "
+          f"in {time.time() - begin:.1f}s -> {writer.path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+# 20-export-onnx.py
+# Converts the fine-tuned SavedModel from 06 to ONNX and applies dynamic int8 quantization
+# to its weights, for `--engine onnx` in 07/18. Check the result with 21-backend-parity.py
+# before scoring with it.
+
+import argparse
+import os
+import subprocess
+import sys
+from scoring import MODEL_PATH, ONNX_MODEL_PATH
+
+
+def export_onnx(model_path, output_path, opset):
+    subprocess.run([sys.executable, "-m", "tf2onnx.convert", "--saved-model", model_path,
+                    "--signature_def", "serving_default", "--opset", str(opset), "--output", output_path],
+                   check=True)
+
+
+def quantize(fp32_path, int8_path):
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    # weights become int8 ahead of time, activations are quantized per batch at run time
+    quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--output", default=ONNX_MODEL_PATH)
+    parser.add_argument("--opset", type=int, default=13)
+    parser.add_argument("--no-quantize", action="store_true", help="keep the fp32 graph only")
+    args = parser.parse_args()
+
+    fp32_path = args.output if args.no_quantize else os.path.splitext(args.output)[0] + ".fp32.onnx"
+    export_onnx(args.model, fp32_path, args.opset)
+    print(f"fp32 : {fp32_path}, {os.path.getsize(fp32_path) / 2**20:.0f} MiB")
+    if not args.no_quantize:
+        quantize(fp32_path, args.output)
+        print(f"int8 : {args.output}, {os.path.getsize(args.output) / 2**20:.0f} MiB")
+
+
+if __name__ == "__main__":
+    main()
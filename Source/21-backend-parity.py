@@ -0,0 +1,162 @@
+# 21-backend-parity.py
+# Scores the same sample of processed reports with two engines (by default the TF
+# SavedModel and the int8 ONNX graph) and reports label agreement, probability deviation,
+# 综合得分 drift and throughput. Exits with 1 when a tolerance is exceeded. The sentences are
+# tokenized once for both engines and only inference is timed.
+# Also used to accept a distilled student (--candidate-model student); with --returns
+# the monthly RankIC of both models' scores is compared as well.
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import numpy as np
+import pandas as pd
+from report_store import BACKENDS, STORE_DIR, PROCESSED_TABLE, open_store
+from scoring import (BATCH_SIZE, ENGINES, MAX_LENGTH, TOKENIZER_PATH, resolve_model, model_engine,
+                     configure_threads, load_predictor, load_tokenizer, prepare_pool, infer_pool, finish_pool)
+
+
+def pick_engine(parser, engine, model, default):
+    # the engine follows the model unless given; a SavedModel cannot go to onnx or vice versa
+    if engine is None:
+        engine = default if model is None else model_engine(resolve_model(default, model))
+    model_path = resolve_model(engine, model)
+    if model_engine(model_path) != engine:
+        parser.error(f"{model_path} is not a model the {engine} engine can run")
+    return engine, model_path
+
+
+def timed_scores(pool, predict, batch_size, pad_id):
+    pool = dict(pool, probs=pool['probs'].copy())
+    begin = time.perf_counter()
+    infer_pool(pool, predict, batch_size, pad_id)
+    seconds = time.perf_counter() - begin
+    results = finish_pool(pool)
+    probs = np.array([doc['原始正面概率'] for _, result in results for doc in result['sentiment_docs']])
+    scores = np.array([result['avg_score'] for _, result in results])
+    return probs, scores, seconds
+
+
+def load_returns(return_dir, codes):
+    # monthly bars from 10, shifted so each return lines up with the month before it as in 11
+    frames = []
+    for file in os.listdir(return_dir):
+        code = file.split("_")[0]
+        if file.endswith(".csv") and code in codes:
+            df = pd.read_csv(os.path.join(return_dir, file), parse_dates=['日期'], usecols=['日期', '涨跌幅'])
+            df['月份'] = (df['日期'] - pd.offsets.MonthEnd(1)).dt.to_period('M')
+            df['股票代码'] = code
+            frames.append(df[['股票代码', '月份', '涨跌幅']])
+    return pd.concat(frames) if frames else pd.DataFrame(columns=['股票代码', '月份', '涨跌幅'])
+
+
+def monthly_rankic(reports, scores, returns):
+    # mean 综合得分 per stock and month against the next month's return, averaged over months
+    df = pd.DataFrame({'股票代码': [r['股票代码'] for r in reports],
+                       '月份': pd.to_datetime([r['发布日期'] for r in reports]).to_period('M'),
+                       '因子值': scores})
+    merged = df.groupby(['股票代码', '月份'], as_index=False)['因子值'].mean().merge(returns, on=['股票代码', '月份'])
+    ics = [group['因子值'].corr(group['涨跌幅'], method='spearman')
+           for _, group in merged.groupby('月份') if len(group) > 1]
+    return float(np.nanmean(ics)) if ics else float('nan')
+
+
+def compare(reference, candidate, sentences):
+    ref_probs, ref_scores, ref_seconds = reference
+    cand_probs, cand_scores, cand_seconds = candidate
+    drift = np.abs(cand_scores - ref_scores)
+    return {
+        "reports": len(ref_scores),
+        "sentences": sentences,
+        "label_agreement": float(np.mean((ref_probs > 0.5) == (cand_probs > 0.5))),
+        "max_prob_deviation": float(np.max(np.abs(cand_probs - ref_probs))),
+        "mean_prob_deviation": float(np.mean(np.abs(cand_probs - ref_probs))),
+        "max_score_drift": float(drift.max()),
+        "mean_score_drift": float(drift.mean()),
+        "score_rank_corr": float(pd.Series(ref_scores).corr(pd.Series(cand_scores), method="spearman")),
+        "reference_sentences_per_sec": round(sentences / ref_seconds, 1),
+        "candidate_sentences_per_sec": round(sentences / cand_seconds, 1),
+        "speedup": round(ref_seconds / cand_seconds, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backend", choices=BACKENDS, default="mongo")
+    parser.add_argument("--store", default=STORE_DIR)
+    parser.add_argument("--start", required=True, help="YYYY-MM-DD, within the scored corpus")
+    parser.add_argument("--end", required=True, help="YYYY-MM-DD")
+    parser.add_argument("--sample", type=int, default=2000, help="reports drawn from the date range, 0 for all")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--reference-engine", choices=ENGINES, help="defaults to tf, or to what --reference-model is")
+    parser.add_argument("--reference-model")
+    parser.add_argument("--candidate-engine", choices=ENGINES, help="defaults to onnx, or to what --candidate-model is")
+    parser.add_argument("--candidate-model")
+    parser.add_argument("--tokenizer", default=TOKENIZER_PATH)
+    parser.add_argument("--threads", type=int, default=0)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--min-agreement", type=float, default=0.99)
+    parser.add_argument("--max-prob-deviation", type=float, default=0.05)
+    parser.add_argument("--max-score-drift", type=float, default=0.01)
+    parser.add_argument("--returns", help="monthly return csvs from 10, adds the RankIC comparison")
+    parser.add_argument("--output", help="write the report as json")
+    args = parser.parse_args()
+    engines = [pick_engine(parser, args.reference_engine, args.reference_model, "tf"),
+               pick_engine(parser, args.candidate_engine, args.candidate_model, "onnx")]
+
+    source = open_store(args.backend, PROCESSED_TABLE, args.store)
+    columns = ['股票代码', '发布日期', '研报标题', '报告链接', '研报文本']
+    reports = [r for r in source.find(args.start, args.end, columns=columns) if r.get('研报文本')]
+    if args.sample and args.sample < len(reports):
+        reports = random.Random(args.seed).sample(reports, args.sample)
+    # an empty sample agrees with anything, so it is a failure rather than a pass
+    if not reports:
+        print(f"no reports between {args.start} and {args.end}, parity : FAILED")
+        sys.exit(1)
+    sentences = sum(len(r['研报文本']) for r in reports)
+    print(f"{len(reports)} reports, {sentences} sentences")
+
+    if "tf" in (engine for engine, _ in engines):
+        configure_threads(args.threads, 1)
+    tokenizer = load_tokenizer(args.tokenizer, fast=True)
+    begin = time.perf_counter()
+    pool = prepare_pool(reports, tokenizer, MAX_LENGTH)
+    if pool is None:
+        print("no sentences in the sample, parity : FAILED")
+        sys.exit(1)
+    print(f"tokenized in {time.perf_counter() - begin:.1f}s (shared, not timed below)")
+    measured = []
+    for engine, model_path in engines:
+        predict = load_predictor(model_path, engine, args.threads)
+        # one warm-up batch so graph building is not timed
+        infer_pool(dict(pool, probs=pool['probs'].copy(), todo=pool['todo'][:1], token_ids=pool['token_ids'][:1]),
+                   predict, args.batch_size, tokenizer.pad_token_id)
+        measured.append(timed_scores(pool, predict, args.batch_size, tokenizer.pad_token_id))
+        print(f"{engine} ({model_path}) : {measured[-1][2]:.1f}s inference")
+
+    if any(len(probs) == 0 for probs, _, _ in measured):
+        print("an engine returned no scores, parity : FAILED")
+        sys.exit(1)
+    report = compare(measured[0], measured[1], sentences)
+    if args.returns:
+        returns = load_returns(args.returns, {r['股票代码'] for r in reports})
+        report["reference_rankic"] = monthly_rankic(reports, measured[0][1], returns)
+        report["candidate_rankic"] = monthly_rankic(reports, measured[1][1], returns)
+    for key, value in report.items():
+        print(f"{key} : {value}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    failed = (report["label_agreement"] < args.min_agreement
+              or report["max_prob_deviation"] > args.max_prob_deviation
+              or report["max_score_drift"] > args.max_score_drift)
+    print("parity : FAILED" if failed else "parity : ok")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
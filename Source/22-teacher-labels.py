@@ -0,0 +1,56 @@
+# 22-teacher-labels.py
+# First step of distillation: the fine-tuned large model (teacher) scores a sample of
+# sentences from the token store written by 19, and its probabilities are saved as the
+# soft labels 23-train-student.py trains on.
+
+import argparse
+import time
+import numpy as np
+from scoring import (BATCH_SIZE, ENGINES, MAX_LENGTH, TOKENIZER_PATH, resolve_model, configure_threads,
+                     load_predictor, load_tokenizer, score_token_ids)
+from token_store import TOKEN_DIR, open_token_store
+
+TEACHER_LABELS = "teacher_labels.npz"
+CHUNK_SENTENCES = 20000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tokens", default=TOKEN_DIR)
+    parser.add_argument("--tokenizer", default=TOKENIZER_PATH)
+    parser.add_argument("--engine", choices=ENGINES, default="tf")
+    parser.add_argument("--model", help="teacher model, defaults to the engine's usual one")
+    parser.add_argument("--sentences", type=int, default=300000, help="sample size, 0 for the whole store")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--threads", type=int, default=0)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--output", default=TEACHER_LABELS)
+    args = parser.parse_args()
+
+    tokenizer = load_tokenizer(args.tokenizer)
+    token_store = open_token_store(args.tokens, "processed", tokenizer, MAX_LENGTH)
+    if token_store is None:
+        print("no token store, run 19-tokenize-corpus.py first")
+        return
+    if args.engine == "tf":
+        configure_threads(args.threads, 1)
+    predict = load_predictor(resolve_model(args.engine, args.model), args.engine, args.threads)
+
+    index = np.arange(len(token_store))
+    if args.sentences and args.sentences < len(index):
+        index = np.sort(np.random.default_rng(args.seed).choice(index, args.sentences, replace=False))
+    probs = np.empty((len(index), 2), dtype=np.float32)
+    begin = time.time()
+    for start in range(0, len(index), CHUNK_SENTENCES):
+        part = index[start:start + CHUNK_SENTENCES]
+        probs[start:start + len(part)] = score_token_ids([token_store.sentence(i) for i in part], predict,
+                                                         args.batch_size, token_store.pad_token_id)
+        done = start + len(part)
+        print(f"{done}/{len(index)} sentences, {done / (time.time() - begin):.1f} sentences/sec")
+
+    np.savez(args.output, index=index, probs=probs, store=token_store.path)
+    print(f"soft labels -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# 23-train-student.py
+# Second step of distillation: a student made of the pretrained checkpoint's embeddings and
+# only its first few transformer layers is trained to match the teacher's soft labels from
+# 22-teacher-labels.py. The saved student has the same serving signature as the teacher,
+# so 07/18 score with it via `--model student`; compare the two with 21-backend-parity.py.
+
+import argparse
+import numpy as np
+import tensorflow as tf
+from transformers import TFBertForSequenceClassification
+from scoring import BATCH_SIZE, STUDENT_MODEL_PATH, TOKENIZER_PATH, length_batches
+from token_store import TokenStore
+
+TEACHER_LABELS = "teacher_labels.npz"
+
+
+def distillation_loss(temperature):
+    # KL between the softened teacher and student distributions; log(p) differs from the
+    # teacher's logits by a per-row constant, so softening it gives the same targets
+    def loss(teacher_probs, logits):
+        targets = tf.nn.softmax(tf.math.log(teacher_probs + 1e-9) / temperature)
+        student = tf.nn.softmax(logits / temperature)
+        return tf.keras.losses.kl_divergence(targets, student) * temperature ** 2
+    return loss
+
+
+def batch_dataset(token_store, index, probs, batch_size, shuffle, seed=0):
+    # length-sorted batches padded to their own longest sentence, visited in random order
+    lengths = np.asarray(token_store.lengths)[index]
+    batches = length_batches(lengths, batch_size)
+    rng = np.random.default_rng(seed)
+
+    def generate():
+        for b in (rng.permutation(len(batches)) if shuffle else range(len(batches))):
+            rows = batches[b]
+            input_ids, attention_mask = token_store.batch(index[rows])
+            yield ({'input_ids': input_ids, 'attention_mask': attention_mask,
+                    'token_type_ids': np.zeros_like(input_ids)}, probs[rows])
+
+    ids_spec = tf.TensorSpec(shape=(None, None), dtype=tf.int32)
+    signature = ({'input_ids': ids_spec, 'attention_mask': ids_spec, 'token_type_ids': ids_spec},
+                 tf.TensorSpec(shape=(None, 2), dtype=tf.float32))
+    return tf.data.Dataset.from_generator(generate, output_signature=signature).prefetch(tf.data.AUTOTUNE)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--labels", default=TEACHER_LABELS)
+    parser.add_argument("--base", default=TOKENIZER_PATH, help="pretrained checkpoint the student starts from")
+    parser.add_argument("--layers", type=int, default=4, choices=range(3, 7))
+    parser.add_argument("--temperature", type=float, default=2.0)
+    parser.add_argument("--epochs", type=int, default=3)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--learning-rate", type=float, default=5e-5)
+    parser.add_argument("--holdout", type=float, default=0.05)
+    parser.add_argument("--threads", type=int, default=6)
+    parser.add_argument("--output", default=STUDENT_MODEL_PATH)
+    args = parser.parse_args()
+
+    tf.config.threading.set_intra_op_parallelism_threads(args.threads)
+    tf.config.threading.set_inter_op_parallelism_threads(args.threads)
+
+    labels = np.load(args.labels)
+    token_store = TokenStore(str(labels["store"]))
+    index, probs = labels["index"], labels["probs"]
+    order = np.random.default_rng(0).permutation(len(index))
+    split = int(len(order) * (1 - args.holdout))
+    train, val = order[:split], order[split:]
+
+    train_dataset = batch_dataset(token_store, index[train], probs[train], args.batch_size, shuffle=True)
+    val_dataset = batch_dataset(token_store, index[val], probs[val], args.batch_size, shuffle=False)
+
+    # from_pretrained keeps the first n layers of the checkpoint when the config asks for fewer
+    model = TFBertForSequenceClassification.from_pretrained(args.base, num_labels=2,
+                                                            num_hidden_layers=args.layers)
+    model.compile(optimizer=tf.keras.optimizers.Adam(learning_rate=args.learning_rate),
+                  loss=distillation_loss(args.temperature))
+    model.fit(train_dataset, epochs=args.epochs, validation_data=val_dataset)
+    model.save(args.output)
+    print(f"student saved -> {args.output}")
+
+    student = np.concatenate([tf.nn.softmax(model(features).logits, axis=-1).numpy()
+                              for features, _ in val_dataset])
+    teacher = np.concatenate([targets.numpy() for _, targets in val_dataset])
+    print(f"held-out agreement with teacher : {np.mean(student.argmax(1) == teacher.argmax(1)):.4f}")
+    print(f"held-out mean prob deviation : {np.mean(np.abs(student[:, 1] - teacher[:, 1])):.4f}")
+
+
+if __name__ == "__main__":
+    main()
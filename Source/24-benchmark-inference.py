@@ -0,0 +1,201 @@
+# 24-benchmark-inference.py
+# Inference throughput benchmark for the scoring path. A fixed, seeded sample of cleaned
+# sentences from the sina-report CSVs (or a synthetic corpus with the same length
+# distribution) is scored under every combination of engine, batch size, max length,
+# intra/inter-op threads and batch ordering. Each configuration runs in a fresh process, so
+# thread settings take effect and peak RSS is its own. Results go to a JSON file that can be
+# compared across commits.
+
+import argparse
+import importlib
+import itertools
+import json
+import multiprocessing as mp
+import os
+import platform
+import random
+import subprocess
+import time
+import numpy as np
+from corpus_io import REPORT_DIR, iter_report_chunks, list_month_files
+from run_metrics import peak_rss_bytes
+from scoring import (ENGINES, ORT_INTER_THREADS, ORT_OPTIMIZATION, ORT_PROVIDERS, TOKENIZER_PATH, configure_threads,
+                     length_batches, load_predictor, load_tokenizer, pad_batch, resolve_model)
+from text_cleaning import clean_reports
+
+OUTPUT_FILE = "benchmark.json"
+WARMUP_BATCHES = 2
+LIBRARIES = ["numpy", "tensorflow", "onnxruntime", "transformers"]
+THREAD_VARIABLES = ["OMP_NUM_THREADS", "MKL_NUM_THREADS", "TF_NUM_INTRAOP_THREADS", "TF_NUM_INTEROP_THREADS",
+                    "TF_ENABLE_ONEDNN_OPTS"]
+
+
+def int_list(value):
+    return [int(v) for v in value.split(",")]
+
+
+def sample_sentences(path, count, seed):
+    # reservoir over every readable month, so the sample does not depend on file order
+    rng = random.Random(seed)
+    sample = []
+    seen = 0
+    for file_name in list_month_files(path):
+        try:
+            for chunk in iter_report_chunks(os.path.join(path, file_name)):
+                for sentences in clean_reports(chunk["研报文本"].tolist()):
+                    for sentence in sentences or []:
+                        seen += 1
+                        if len(sample) < count:
+                            sample.append(sentence)
+                        else:
+                            slot = rng.randrange(seen)
+                            if slot < count:
+                                sample[slot] = sentence
+        except (UnicodeDecodeError, ValueError) as e:
+            print(f"skipped {file_name}: {e}")
+    return sample
+
+
+def synthetic_ids(lengths, vocab_size, seed, cls_id=101, sep_id=102):
+    # random ids between [CLS] and [SEP]; speed depends on shape, not on which ids they are
+    rng = np.random.default_rng(seed)
+    return [np.concatenate([[cls_id], rng.integers(1000, vocab_size, n - 2), [sep_id]]).astype(np.int32)
+            for n in lengths]
+
+
+def run_config(config, token_ids, pad_id):
+    if config["engine"] == "tf":
+        configure_threads(config["intra_threads"], config["inter_threads"])
+    predict = load_predictor(config["model"], config["engine"], config["intra_threads"])
+    # truncate as the tokenizer would, keeping the closing [SEP]
+    token_ids = [ids if len(ids) <= config["max_length"] else np.append(ids[:config["max_length"] - 1], ids[-1])
+                 for ids in token_ids]
+    lengths = np.array([len(ids) for ids in token_ids])
+    if config["ordering"] == "sorted":
+        batches = length_batches(lengths, config["batch_size"])
+    else:
+        order = np.arange(len(token_ids))
+        batches = [order[i:i + config["batch_size"]] for i in range(0, len(order), config["batch_size"])]
+
+    for index in batches[:WARMUP_BATCHES]:
+        predict(*pad_batch([token_ids[i] for i in index], pad_id))
+    latencies = []
+    real = padded = 0
+    begin = time.perf_counter()
+    for index in batches:
+        input_ids, attention_mask = pad_batch([token_ids[i] for i in index], pad_id)
+        start = time.perf_counter()
+        predict(input_ids, attention_mask)
+        latencies.append(time.perf_counter() - start)
+        real += int(attention_mask.sum())
+        padded += attention_mask.size
+    seconds = time.perf_counter() - begin
+    latencies = np.array(latencies) * 1000
+    peak_rss = peak_rss_bytes()
+    return dict(config,
+                engine_threads=engine_threads(config),
+                sentences=len(token_ids),
+                sentences_per_sec=round(len(token_ids) / seconds, 2),
+                p50_batch_ms=round(float(np.percentile(latencies, 50)), 2),
+                p99_batch_ms=round(float(np.percentile(latencies, 99)), 2),
+                peak_rss_mb=round(peak_rss / 2 ** 20, 1) if peak_rss is not None else None,
+                padding_efficiency=round(real / padded, 4))
+
+
+def engine_threads(config):
+    # what the engine actually runs with: ONNX Runtime ignores --inter-threads
+    if config["engine"] == "onnx":
+        return {"intra_op": config["intra_threads"], "inter_op": ORT_INTER_THREADS}
+    import tensorflow as tf
+    return {"intra_op": tf.config.threading.get_intra_op_parallelism_threads(),
+            "inter_op": tf.config.threading.get_inter_op_parallelism_threads()}
+
+
+def library_version(name):
+    try:
+        return importlib.import_module(name).__version__
+    except ImportError:
+        return None
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    try:
+        import onnxruntime as ort
+        available_providers = ort.get_available_providers()
+    except ImportError:
+        available_providers = None
+    return {"commit": commit, "python": platform.python_version(),
+            "libraries": {name: library_version(name) for name in LIBRARIES},
+            "onnxruntime": {"providers": ORT_PROVIDERS, "available_providers": available_providers,
+                            "inter_op_threads": ORT_INTER_THREADS, "graph_optimization": ORT_OPTIMIZATION},
+            "thread_variables": {name: os.environ.get(name) for name in THREAD_VARIABLES},
+            "platform": platform.platform(), "processor": platform.processor(), "cpus": os.cpu_count()}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--path", default=REPORT_DIR)
+    parser.add_argument("--synthetic", action="store_true",
+                        help="random ids with the length distribution of a small real sample")
+    parser.add_argument("--sentences", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--tokenizer", default=TOKENIZER_PATH)
+    parser.add_argument("--engines", default="tf", help="comma separated: " + ",".join(ENGINES))
+    parser.add_argument("--model", help="model path or teacher/student for every engine")
+    parser.add_argument("--batch-sizes", type=int_list, default=[8, 16, 32, 64])
+    parser.add_argument("--max-lengths", type=int_list, default=[128, 256, 500])
+    parser.add_argument("--intra-threads", type=int_list, default=[os.cpu_count() or 1])
+    parser.add_argument("--inter-threads", type=int_list, default=[1])
+    parser.add_argument("--orderings", default="sorted", help="comma separated: sorted,arrival")
+    parser.add_argument("--output", default=OUTPUT_FILE)
+    args = parser.parse_args()
+
+    tokenizer = load_tokenizer(args.tokenizer, fast=True)
+    if args.synthetic:
+        real = sample_sentences(args.path, min(args.sentences, 500), args.seed)
+        real_ids = tokenizer(real, truncation=True, max_length=max(args.max_lengths))['input_ids']
+        real_lengths = [len(ids) for ids in real_ids]
+        lengths = np.random.default_rng(args.seed).choice(real_lengths, args.sentences)
+        token_ids = synthetic_ids(lengths, tokenizer.vocab_size, args.seed,
+                                  tokenizer.cls_token_id, tokenizer.sep_token_id)
+    else:
+        sentences = sample_sentences(args.path, args.sentences, args.seed)
+        token_ids = [np.asarray(ids, dtype=np.int32) for ids in
+                     tokenizer(sentences, truncation=True, max_length=max(args.max_lengths))['input_ids']]
+    print(f"{len(token_ids)} sentences, mean length {np.mean([len(ids) for ids in token_ids]):.1f} tokens")
+
+    configs = [{"engine": engine, "model": resolve_model(engine, args.model), "batch_size": batch_size,
+                "max_length": max_length, "intra_threads": intra, "inter_threads": inter, "ordering": ordering}
+               for engine, batch_size, max_length, intra, inter, ordering in itertools.product(
+                   args.engines.split(","), args.batch_sizes, args.max_lengths,
+                   args.intra_threads, args.inter_threads, args.orderings.split(","))]
+
+    results = []
+    ctx = mp.get_context("spawn")
+    for config in configs:
+        # a fresh interpreter per configuration: TF thread pools are fixed once created
+        with ctx.Pool(1) as pool:
+            try:
+                result = pool.apply(run_config, (config, token_ids, tokenizer.pad_token_id))
+            except Exception as e:
+                print(f"{config} failed : {str(e)}")
+                continue
+        results.append(result)
+        print(f"{config['engine']} batch {config['batch_size']} len {config['max_length']} "
+              f"threads {config['intra_threads']}x{config['inter_threads']} {config['ordering']} : "
+              f"{result['sentences_per_sec']} sentences/sec, p50 {result['p50_batch_ms']}ms, "
+              f"p99 {result['p99_batch_ms']}ms, rss {result['peak_rss_mb']}MB, "
+              f"padding {result['padding_efficiency']:.1%}")
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"environment": environment(), "sentences": len(token_ids), "seed": args.seed,
+                   "synthetic": args.synthetic, "results": results}, f, indent=2)
+    print(f"results -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
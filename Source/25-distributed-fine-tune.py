@@ -0,0 +1,204 @@
+# 25-distributed-fine-tune.py
+# 06 across several CPU machines: every worker in the cluster file runs this script with its
+# own --index, trains a full replica on its slice of the training rows, and gradients are
+# all-reduced synchronously after every step (MultiWorkerMirroredStrategy). Training state is
+# backed up each epoch, so after a lost node the same command on every worker resumes from
+# the last backup instead of from the start. --local N runs N workers on this machine.
+#
+# cluster file: {"worker": ["10.0.0.1:23456", "10.0.0.2:23456", ...]}, worker 0 is the chief.
+# The csv (or training token store) must be readable on every worker under the same path.
+
+import argparse
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import numpy as np
+from scoring import MAX_LENGTH, MODEL_PATH, TOKENIZER_PATH
+from token_store import TOKEN_DIR
+
+CLUSTER_FILE = "cluster.json"
+BACKUP_DIR = "training_backup"
+
+
+def load_cluster(path):
+    with open(path, encoding="utf-8") as f:
+        workers = json.load(f)["worker"]
+    if not workers:
+        raise ValueError(f"{path} lists no workers")
+    return workers
+
+
+def free_ports(count):
+    sockets = [socket.socket() for _ in range(count)]
+    for s in sockets:
+        s.bind(("localhost", 0))
+    ports = [s.getsockname()[1] for s in sockets]
+    for s in sockets:
+        s.close()
+    return ports
+
+
+def without_flag(argv, flag):
+    # drops "--flag value" and "--flag=value" from argv
+    result = []
+    skip = False
+    for arg in argv:
+        if skip:
+            skip = False
+        elif arg == flag:
+            skip = True
+        elif not arg.startswith(flag + "="):
+            result.append(arg)
+    return result
+
+
+def run_local(args):
+    # one process per worker on localhost, sharing the cores between them; the cluster spec
+    # goes to a temporary file so the real --cluster file is left alone
+    workers = [f"localhost:{port}" for port in free_ports(args.local)]
+    fd, cluster_path = tempfile.mkstemp(prefix="local-cluster-", suffix=".json")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump({"worker": workers}, f, indent=2)
+    threads = max(1, (os.cpu_count() or 1) // args.local)
+    child_argv = sys.argv[1:]
+    for flag in ["--local", "--threads", "--cluster", "--index"]:
+        child_argv = without_flag(child_argv, flag)
+    processes = [subprocess.Popen([sys.executable, os.path.abspath(__file__)] + child_argv +
+                                  ["--cluster", cluster_path, "--index", str(i), "--threads", str(threads)])
+                 for i in range(args.local)]
+    print(f"{args.local} local workers ({threads} threads each) : {', '.join(workers)}")
+    failed = False
+    try:
+        for i, process in enumerate(processes):
+            if process.wait() != 0:
+                print(f"worker {i} exited with {process.returncode}")
+                failed = True
+    finally:
+        # a dead worker leaves the others blocked in the all-reduce, so they are stopped too
+        for process in processes:
+            if process.poll() is None:
+                process.terminate()
+        for process in processes:
+            process.wait()
+        os.remove(cluster_path)
+    return 1 if failed else 0
+
+
+def split_rows(args, token_store):
+    from training_data import count_rows, is_validation
+    total = len(token_store) if token_store is not None else count_rows(args.data, args.text_column)
+    validation = is_validation(np.arange(total))
+    return int((~validation).sum()), int(validation.sum())
+
+
+def train(args):
+    workers = load_cluster(args.cluster)
+    # TF_CONFIG has to be in place before tensorflow builds its cluster resolver
+    os.environ["TF_CONFIG"] = json.dumps({"cluster": {"worker": workers},
+                                          "task": {"type": "worker", "index": args.index}})
+    import tensorflow as tf
+    from transformers import BertTokenizerFast, TFBertForSequenceClassification
+    from token_store import open_token_store
+    from training_data import csv_examples, store_examples, store_matches, make_dataset
+
+    tf.config.threading.set_intra_op_parallelism_threads(args.threads)
+    tf.config.threading.set_inter_op_parallelism_threads(args.threads)
+    # ring all-reduce over grpc, the collective implementation that works without GPUs
+    strategy = tf.distribute.MultiWorkerMirroredStrategy(
+        communication_options=tf.distribute.experimental.CommunicationOptions(
+            implementation=tf.distribute.experimental.CommunicationImplementation.RING))
+    num_workers = strategy.num_replicas_in_sync
+    chief = args.index == 0
+
+    tokenizer = BertTokenizerFast.from_pretrained(args.base)
+    token_store = open_token_store(args.tokens, "training", tokenizer, args.max_length)
+    if not store_matches(token_store, args.data):
+        token_store = None
+
+    def examples(validation, input_context):
+        # each worker only reads and tokenizes its own rows, so tf.data does not shard again
+        shards, shard = input_context.num_input_pipelines, input_context.input_pipeline_id
+        if token_store is not None:
+            return store_examples(token_store, validation, args.max_length, shards, shard)
+        return csv_examples(args.data, args.text_column, args.label_column, tokenizer, args.max_length,
+                            validation, shards, shard)
+
+    # Keras splits whatever batch a plain dataset yields across the replicas, so each worker's
+    # pipeline is built per replica: batch_size rows on every worker, batch_size * workers in
+    # every synchronous step
+    global_batch = args.batch_size * num_workers
+
+    def distributed_dataset(validation):
+        def build(input_context):
+            batch_size = input_context.get_per_replica_batch_size(global_batch)
+            return make_dataset(examples(validation, input_context), batch_size, tokenizer.pad_token_id,
+                                shuffle=not validation).repeat()
+        return strategy.distribute_datasets_from_function(build)
+
+    train_dataset = distributed_dataset(False)
+    val_dataset = distributed_dataset(True)
+
+    # every worker has to run the same number of steps or the all-reduce waits forever, so
+    # epochs are counted in global batches and the shards repeat
+    train_rows, val_rows = split_rows(args, token_store)
+    steps_per_epoch = max(1, train_rows // global_batch)
+    validation_steps = max(1, val_rows // global_batch)
+    print(f"worker {args.index}/{num_workers} : {train_rows} training rows, {steps_per_epoch} steps per epoch, "
+          f"global batch {global_batch}")
+
+    with strategy.scope():
+        model = TFBertForSequenceClassification.from_pretrained(args.base, num_labels=2)
+        model.compile(optimizer=tf.keras.optimizers.Adam(learning_rate=args.learning_rate),
+                      loss=tf.keras.losses.SparseCategoricalCrossentropy(from_logits=True),
+                      metrics=['accuracy'])
+
+    # weights, optimizer state and the epoch counter; removed again once fit() completes
+    backup = tf.keras.callbacks.BackupAndRestore(args.backup_dir, save_freq=args.backup_steps or "epoch")
+    model.fit(train_dataset, epochs=args.epochs, steps_per_epoch=steps_per_epoch,
+              validation_data=val_dataset, validation_steps=validation_steps, callbacks=[backup])
+
+    # saving runs collectives too, so every worker saves; only the chief's copy is kept
+    output = args.output if chief else f"{args.output}.worker{args.index}"
+    model.save(output)
+    if chief:
+        print(f"model saved -> {output}")
+    else:
+        shutil.rmtree(output, ignore_errors=True)
+
+    val_loss, val_accuracy = model.evaluate(val_dataset, steps=validation_steps)
+    if chief:
+        print(f"validation loss: {val_loss}")
+        print(f"validation accuracy: {val_accuracy}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cluster", default=CLUSTER_FILE, help="json file with the worker list")
+    parser.add_argument("--index", type=int, default=0, help="this worker's position in the list")
+    parser.add_argument("--local", type=int, default=0, help="start this many workers on localhost")
+    parser.add_argument("--data", default="test_data.csv")
+    parser.add_argument("--text-column", default="标题")
+    parser.add_argument("--label-column", default="正负面")
+    parser.add_argument("--tokens", default=TOKEN_DIR)
+    parser.add_argument("--base", default=TOKENIZER_PATH, help="pretrained checkpoint to fine-tune")
+    parser.add_argument("--max-length", type=int, default=MAX_LENGTH)
+    parser.add_argument("--batch-size", type=int, default=8, help="per worker")
+    parser.add_argument("--learning-rate", type=float, default=0.00001)
+    parser.add_argument("--epochs", type=int, default=5)
+    parser.add_argument("--threads", type=int, default=6)
+    parser.add_argument("--backup-dir", default=BACKUP_DIR)
+    parser.add_argument("--backup-steps", type=int, default=0, help="also back up every n steps (0: per epoch)")
+    parser.add_argument("--output", default=MODEL_PATH)
+    args = parser.parse_args()
+
+    if args.local:
+        sys.exit(run_local(args))
+    train(args)
+
+
+if __name__ == "__main__":
+    main()
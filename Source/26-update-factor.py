@@ -0,0 +1,62 @@
+# 26-update-factor.py
+# Incremental 09: keeps the sentiment factor in a state directory (see factor_state.py) and,
+# after new reports have been scored, recomputes only the dates they can affect. The daily job
+# runs it with the day just scored; a late batch of older reports is given as a wider range.
+# The first run, or --rebuild, builds the whole history from the store.
+
+import argparse
+import time
+from report_store import BACKENDS, REDUCERS, STORE_DIR, PROCESSED_TABLE, open_store
+from factor_engine import HALFLIFE, SCHEMES, WINDOW, decay_weights
+from factor_panel import save_factor_panel
+from factor_state import FACTOR_DIR, FactorState, check_rebuild
+from score_panel import load_panel
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backend", choices=BACKENDS, default="mongo")
+    parser.add_argument("--store", default=STORE_DIR)
+    parser.add_argument("--state", default=FACTOR_DIR)
+    parser.add_argument("--reducer", choices=REDUCERS, default="mean", help="for several reports of a stock on one date")
+    parser.add_argument("--start", help="first publish date (YYYY-MM-DD) whose scores arrived or changed")
+    parser.add_argument("--end", help="last such date, defaults to --start")
+    parser.add_argument("--rebuild", action="store_true", help="rebuild from every scored report in the store")
+    parser.add_argument("--window", type=int, default=WINDOW, help="report dates in the decay window")
+    parser.add_argument("--weights", choices=SCHEMES, default="reciprocal")
+    parser.add_argument("--halflife", type=float, default=HALFLIFE, help="for --weights exponential")
+    parser.add_argument("--verify", action="store_true", help="compare the history with a full rebuild afterwards")
+    parser.add_argument("--export", help="also write the factor history as a factor panel for 11/14")
+    args = parser.parse_args()
+
+    begin = time.time()
+    collection = open_store(args.backend, PROCESSED_TABLE, args.store)
+    state = FactorState(args.state, decay_weights(args.window, args.weights, args.halflife), args.reducer)
+
+    if args.rebuild or state.empty:
+        dates = state.rebuild(load_panel(collection, reducer=args.reducer))
+        print(f"factor rebuilt for {dates} dates, {len(state.panel.codes)} stocks -> {args.state}")
+    else:
+        if not args.start:
+            parser.error("--start is required once the state exists (or pass --rebuild)")
+        end = args.end or args.start
+        dates = state.update(load_panel(collection, args.start, end, args.reducer), args.start, end)
+        if dates:
+            print(f"factor updated for {len(dates)} dates ({dates[0]} ~ {dates[-1]})")
+        else:
+            print(f"no scored reports between {args.start} and {end}")
+
+    if args.verify:
+        diff = check_rebuild(state)
+        print(f"max difference from a full rebuild: {diff}")
+        if diff != 0.0:
+            raise SystemExit("incremental factor differs from a full rebuild")
+
+    if args.export:
+        save_factor_panel(state.factor_panel(), args.export)
+        print(f"history -> {args.export}")
+    print(f"took {time.time() - begin:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+# 27-export-panel.py
+# Writes a factor panel (see factor_panel.py) as a spreadsheet for looking at. The pipeline
+# itself reads the binary panels; this is the old stock_scores.xlsx / pivoted.xlsx on demand.
+
+import argparse
+from factor_panel import FACTOR_PANEL, load_factor_panel
+
+EXCEL_MAX_COLUMNS = 16384
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--panel", default=FACTOR_PANEL)
+    parser.add_argument("--output", default="pivoted.xlsx")
+    parser.add_argument("--layout", choices=["dates", "stocks"], default="dates",
+                        help="one row per date (pivoted.xlsx) or one row per stock (stock_scores.xlsx)")
+    parser.add_argument("--start", help="first date to include (YYYY-MM-DD)")
+    parser.add_argument("--end", help="last date to include")
+    args = parser.parse_args()
+
+    panel = load_factor_panel(args.panel)
+    if args.start or args.end:
+        keep = [i for i, date in enumerate(panel.dates)
+                if (not args.start or date >= args.start) and (not args.end or date <= args.end)]
+        panel = panel.select_dates(keep)
+    columns = len(panel.codes) if args.layout == "dates" else len(panel.dates)
+    if columns + 1 > EXCEL_MAX_COLUMNS:
+        parser.error(f"{columns} columns do not fit in a sheet, narrow --start/--end or switch --layout")
+
+    if args.layout == "dates":
+        panel.to_pivot().to_excel(args.output)
+    else:
+        panel.to_frame().to_excel(args.output, index=False)
+    print(f"{len(panel.codes)} stocks x {len(panel.dates)} dates -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+# 28-research-pipeline.py
+# 08 -> 09 -> 11 -> 14 as one command. The stages are extraction, factor build,
+# standardization, RankIC, layering and the backtest against the index. Each one is cached
+# on disk under a hash of its inputs and parameters (see stage_cache.py), so changing, say,
+# --layers reruns only the layering and the backtest. Date range, paths and research
+# parameters are all options; results go to --output-dir.
+
+import argparse
+import json
+import os
+import time
+import pandas as pd
+from report_store import (BACKENDS, REDUCERS, STORE_DIR, PROCESSED_TABLE, list_months, months_between,
+                          open_store, partition_path)
+from factor_engine import HALFLIFE, SCHEMES, WINDOW, decay_weights, decayed_panel
+from factor_research import (LAYERS, calculate_excess_returns, calculate_rankic, drop_last_month,
+                             index_monthly_returns, index_range, layered_factor, load_daily_returns, load_monthly_returns,
+                             merge_layers, standardized_factor)
+from market_data import MARKET_DIR, MarketData
+from score_panel import load_panel
+from stage_cache import CACHE_DIR, StageCache, files_fingerprint
+
+STAGES = ["extract", "factor", "standardized", "monthly_returns", "rankic",
+          "layers", "daily_returns", "index_returns", "backtest"]
+MONTHLY_RETURN_DIR = r"D:\Projects\history-month"
+DAILY_RETURN_DIR = r"D:\Projects\new-history"
+INDEX_SYMBOL = "sh000001"
+
+
+def csv_files(path):
+    return [os.path.join(path, name) for name in os.listdir(path) if name.endswith(".csv")]
+
+
+def store_fingerprint(args):
+    # parquet partitions can be fingerprinted from their file stats; mongo cannot
+    if args.backend != "parquet":
+        return None
+    wanted = set(months_between(args.start, args.end))
+    return files_fingerprint([partition_path(args.store, PROCESSED_TABLE, year, month)
+                              for year, month in list_months(args.store, PROCESSED_TABLE)
+                              if (year, month) in wanted])
+
+
+def fetch_index(market, symbol, first, last):
+    bars = market.history(symbol, first, last).reset_index()
+    return index_monthly_returns(bars.rename(columns={'日期': 'date', '收盘': 'close'})).to_frame()
+
+
+def run(args, cache):
+    source = open_store(args.backend, PROCESSED_TABLE, args.store)
+    extract_params = {"backend": args.backend, "start": args.start, "end": args.end, "reducer": args.reducer}
+    fingerprint = store_fingerprint(args)
+    if fingerprint is None:
+        scores = cache.source("extract", "panel", lambda: load_panel(source, args.start, args.end, args.reducer))
+    else:
+        scores = cache.stage("extract", "panel", dict(extract_params, store=fingerprint), {},
+                             lambda: load_panel(source, args.start, args.end, args.reducer))
+
+    weights = decay_weights(args.window, args.weights, args.halflife)
+    factor = cache.stage("factor", "panel", {"weights": weights}, {"scores": scores},
+                         lambda scores: decayed_panel(scores, weights))
+
+    results = {}
+    if "rankic" in args.evaluate:
+        standardized = cache.stage("standardized", "frame", {}, {"factor": factor}, standardized_factor)
+        first_month = str(pd.Period(args.start, freq='M'))
+        monthly_returns = cache.stage(
+            "monthly_returns", "frame",
+            {"dir": args.monthly_returns, "files": files_fingerprint(csv_files(args.monthly_returns)),
+             "first_month": first_month}, {},
+            lambda: load_monthly_returns(args.monthly_returns, first_month))
+        rankic = cache.stage("rankic", "frame", {}, {"factor_df": standardized, "return_df": monthly_returns},
+                             calculate_rankic)
+        results["rankic"] = rankic.value
+
+    if "backtest" in args.evaluate:
+        layers = cache.stage("layers", "frame", {"layers": args.layers}, {"panel": factor},
+                             lambda panel: layered_factor(panel, args.layers))
+        daily_returns = cache.stage(
+            "daily_returns", "frame",
+            {"dir": args.daily_returns, "files": files_fingerprint(csv_files(args.daily_returns))}, {},
+            lambda: load_daily_returns(args.daily_returns))
+        # keyed by the dates it covers, so a run before the range has fully played out refetches later
+        first, last = index_range(args.start, args.end)
+        index_returns = cache.stage("index_returns", "frame", {"symbol": args.index, "first": first, "last": last},
+                                    {}, lambda: fetch_index(MarketData(args.market_data), args.index, first, last))
+
+        def backtest(monthly_factor, return_df, index_df):
+            df = merge_layers(monthly_factor, return_df)
+            excess, _ = calculate_excess_returns(drop_last_month(df), index_df['monthly_return'])
+            return excess
+
+        excess = cache.stage("backtest", "frame", {},
+                             {"monthly_factor": layers, "return_df": daily_returns, "index_df": index_returns},
+                             backtest)
+        results["excess"] = excess.value
+    return results
+
+
+def report(args, results):
+    from scipy import stats
+    os.makedirs(args.output_dir, exist_ok=True)
+    if "rankic" in results:
+        rankic_df = results["rankic"]
+        rankic_df.to_csv(os.path.join(args.output_dir, "RankIC.csv"), index=False)
+        print(f"\nRankIC over {len(rankic_df)} months")
+        if not rankic_df.empty:
+            print(f"Average: {rankic_df['RankIC'].mean():.4f}")
+            print(f"p<0.05: {(rankic_df['p值'] < 0.05).mean():.2%}")
+            print(f"Std: {rankic_df['RankIC'].std():.4f}")
+            print(f"max: {rankic_df['RankIC'].max():.4f}")
+            print(f"min: {rankic_df['RankIC'].min():.4f}")
+    if "excess" in results:
+        excess_ret = results["excess"]
+        cum_ret = (1 + excess_ret).cumprod() - 1
+        excess_ret.to_csv(os.path.join(args.output_dir, "excess_returns.csv"))
+        cum_ret.to_csv(os.path.join(args.output_dir, "cumulative_excess_returns.csv"))
+        print(f"\nAvg. excess return for every layer (vs {args.index}):")
+        print(excess_ret.mean())
+        print("\nT-Value:")
+        for layer in excess_ret.columns:
+            t_stat, p_value = stats.ttest_1samp(excess_ret[layer].dropna(), 0)
+            print(f"Layer {layer}: t={t_stat:.3f} (p={p_value:.3f})")
+        if args.plot:
+            import matplotlib.pyplot as plt
+            cum_ret.plot(figsize=(12, 6), title=f'Cumulative Monthly Excess Returns (vs {args.index})')
+            plt.ylabel('Cumulative Excess Return')
+            plt.xlabel('Month')
+            plt.grid(True)
+            plt.savefig(os.path.join(args.output_dir, "cumulative_excess_returns.png"))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backend", choices=BACKENDS, default="mongo")
+    parser.add_argument("--store", default=STORE_DIR)
+    parser.add_argument("--start", default="2008-01-01")
+    parser.add_argument("--end", default="2008-09-27")
+    parser.add_argument("--reducer", choices=REDUCERS, default="mean")
+    parser.add_argument("--window", type=int, default=WINDOW)
+    parser.add_argument("--weights", choices=SCHEMES, default="reciprocal")
+    parser.add_argument("--halflife", type=float, default=HALFLIFE)
+    parser.add_argument("--layers", type=int, default=LAYERS)
+    parser.add_argument("--monthly-returns", default=MONTHLY_RETURN_DIR, help="monthly history csvs for RankIC")
+    parser.add_argument("--daily-returns", default=DAILY_RETURN_DIR, help="history csvs for the backtest")
+    parser.add_argument("--index", default=INDEX_SYMBOL, help="benchmark index for excess returns")
+    parser.add_argument("--market-data", default=MARKET_DIR, help="local price cache the index is read through")
+    parser.add_argument("--evaluate", default="rankic,backtest", help="comma separated: rankic,backtest")
+    parser.add_argument("--cache", default=CACHE_DIR)
+    parser.add_argument("--force", default="", help="comma separated stages to recompute: " + ",".join(STAGES))
+    parser.add_argument("--output-dir", default="research_output")
+    parser.add_argument("--plot", action="store_true")
+    args = parser.parse_args()
+    args.evaluate = args.evaluate.split(",")
+
+    begin = time.time()
+    cache = StageCache(args.cache, [s for s in args.force.split(",") if s])
+    results = run(args, cache)
+    report(args, results)
+    with open(os.path.join(args.output_dir, "stages.json"), "w", encoding="utf-8") as f:
+        json.dump({"args": vars(args), "stages": cache.log}, f, ensure_ascii=False, indent=2)
+    print(f"\ntook {time.time() - begin:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
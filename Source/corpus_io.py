@@ -0,0 +1,134 @@
+# corpus_io.py
+# Shared helpers for the monthly sina-report CSV files (YYYY-MM.csv).
+
+import os
+import json
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+
+REPORT_DIR = r"D:\Projects\sina-report"
+REPORT_COLUMNS = ["股票代码", "券商简称", "发布日期", "研报标题", "报告链接", "研报文本", "研究员"]
+URL_FIELD = "报告链接"
+MANIFEST_FILE = "manifest.json"
+BLOCK_SIZE = 1 << 20
+
+
+def list_month_files(path):
+    return sorted(f for f in os.listdir(path) if f.endswith(".csv"))
+
+
+def split_month(file_name):
+    year, month = os.path.splitext(file_name)[0].split('-')
+    return year, month
+
+
+def iter_report_chunks(file_path, chunksize=20000):
+    # stock codes stay strings so "002203" keeps its leading zeros
+    return pd.read_csv(file_path, usecols=REPORT_COLUMNS, dtype={"股票代码": str},
+                       encoding="utf-8-sig", chunksize=chunksize)
+
+
+def build_records(chunk, file_name):
+    year, month = split_month(file_name)
+    chunk = chunk.astype(object).where(chunk.notna(), None)
+    chunk["年份"] = year
+    chunk["月份"] = month
+    return chunk.to_dict("records")
+
+
+def file_sha256(file_path, block_size=BLOCK_SIZE):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for block in iter(lambda: file.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def scan_file(file_path, block_size=BLOCK_SIZE):
+    # one pass over the raw bytes: CSV records (newlines outside quotes) and content hash.
+    # Splitting on the quote char alternates unquoted/quoted segments; an escaped "" just
+    # yields an empty quoted segment, so the parity stays right across blocks.
+    digest = hashlib.sha256()
+    in_quote = False
+    newlines = 0
+    last = b"\n"
+    with open(file_path, "rb") as file:
+        while True:
+            block = file.read(block_size)
+            if not block:
+                break
+            digest.update(block)
+            parts = block.split(b'"')
+            for i, part in enumerate(parts):
+                if not in_quote:
+                    newlines += part.count(b"\n")
+                if i < len(parts) - 1:
+                    in_quote = not in_quote
+            last = block[-1:]
+    lines = newlines + (0 if last == b"\n" else 1)
+    stat = os.stat(file_path)
+    return {
+        "rows": max(lines - 1, 0),
+        "bytes": stat.st_size,
+        "mtime": stat.st_mtime,
+        "sha256": digest.hexdigest(),
+    }
+
+
+def build_manifest(path, workers=None):
+    files = list_month_files(path)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        entries = pool.map(scan_file, [os.path.join(path, f) for f in files])
+        manifest = {"files": dict(zip(files, entries))}
+    manifest["total_rows"] = sum(entry["rows"] for entry in manifest["files"].values())
+    return manifest
+
+
+def load_manifest(manifest_path):
+    if not os.path.exists(manifest_path):
+        return {"files": {}, "total_rows": 0}
+    with open(manifest_path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_json_atomic(value, path):
+    # written beside the target and swapped in, so a crash never leaves half a file
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(value, f, ensure_ascii=False, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def save_manifest(manifest, manifest_path):
+    write_json_atomic(manifest, manifest_path)
+
+
+def diff_manifest(previous, current):
+    changed = [f for f, entry in current["files"].items()
+               if previous["files"].get(f, {}).get("sha256") != entry["sha256"]]
+    removed = [f for f in previous["files"] if f not in current["files"]]
+    return changed, removed
+
+
+def touched_key(backend):
+    # mongo runs list document _ids, parquet runs list YYYY-MM partitions
+    return "months" if backend == "parquet" else "ids"
+
+
+def write_touched(touched, touched_path):
+    write_json_atomic({key: sorted(set(values)) for key, values in touched.items()}, touched_path)
+
+
+def load_touched(touched_path):
+    with open(touched_path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_touched(touched_path, backend, touched):
+    # merged into what is already listed: entries only leave the file once a downstream
+    # stage has processed them (see report_store.consume_touched)
+    current = load_touched(touched_path) if os.path.exists(touched_path) else {}
+    key = touched_key(backend)
+    current[key] = set(current.get(key, [])) | set(touched)
+    write_touched(current, touched_path)
@@ -0,0 +1,65 @@
+# factor_engine.py
+# The report sentiment factor built by 09: for every stock and report date, a weighted mean of
+# the stock's scores over the last `window` report dates, where a date without a report counts
+# as 0. The window is applied as one multiply-add per lag over the whole stock x date matrix
+# instead of a Python loop per cell. Lags are added in the same order as the old per-cell
+# loop, so the numbers are bit-for-bit the same. A sparse score panel (score_panel.py) is
+# handled a block of stocks at a time, so only one block is ever dense.
+
+import numpy as np
+from scipy import sparse
+from score_panel import ScorePanel
+
+WINDOW = 90
+HALFLIFE = 20
+BLOCK_STOCKS = 512
+SCHEMES = ["reciprocal", "linear", "exponential", "equal"]
+
+
+def decay_weights(window=WINDOW, scheme="reciprocal", halflife=HALFLIFE):
+    # weights[i] applies to the score i report dates back. "reciprocal" is the original 09
+    # scheme, 1/(window-i), which puts the most weight on the oldest date in the window
+    lags = range(window)
+    if scheme == "reciprocal":
+        return [1 / (window - i) for i in lags]
+    if scheme == "linear":
+        return [(window - i) / window for i in lags]
+    if scheme == "exponential":
+        return [0.5 ** (i / halflife) for i in lags]
+    if scheme == "equal":
+        return [1.0 for _ in lags]
+    raise ValueError(f"unknown weight scheme {scheme}, expected one of {SCHEMES}")
+
+
+def total_weight(weights):
+    # summed one by one like the original loop, not with np.sum's pairwise order
+    total = 0
+    for weight in weights:
+        total += weight
+    return total
+
+
+def decayed_scores(matrix, weights):
+    # matrix is stocks x dates with the earliest date first; returns the factor, same shape
+    matrix = np.asarray(matrix, dtype=np.float64)
+    weighted = np.zeros_like(matrix)
+    dates = matrix.shape[1]
+    for lag, weight in enumerate(weights[:dates]):
+        weighted[:, lag:] += matrix[:, :dates - lag] * weight
+    total = total_weight(weights)
+    return weighted / total if total != 0 else np.zeros_like(matrix)
+
+
+def decayed_sparse(matrix, weights, block=BLOCK_STOCKS):
+    # same numbers as decayed_scores; the factor is kept sparse too, since it is zero for
+    # every date more than a window after a stock's last report
+    matrix = sparse.csr_matrix(matrix)
+    blocks = [sparse.csr_matrix(decayed_scores(matrix[start:start + block].toarray(), weights))
+              for start in range(0, matrix.shape[0], block)]
+    if not blocks:
+        return sparse.csr_matrix(matrix.shape, dtype=np.float64)
+    return sparse.vstack(blocks, format="csr")
+
+
+def decayed_panel(panel, weights):
+    return ScorePanel(panel.codes, panel.dates, decayed_sparse(panel.matrix, weights))
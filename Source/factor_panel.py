@@ -0,0 +1,65 @@
+# factor_panel.py
+# On-disk format for the stock x date panels handed between stages (08's scores, 09/26's
+# factor): a directory of .npy files, stock codes and dates as index arrays plus the CSR
+# arrays of the values. np.load memory-maps them, so opening a decade-long panel costs a few
+# milliseconds whatever its size, and there is no column limit. 11 and 14 read it;
+# 27-export-panel.py writes a spreadsheet of it for looking at.
+
+import os
+import shutil
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from score_panel import ScorePanel
+
+SCORE_PANEL = "stock_scores"
+FACTOR_PANEL = "factor_panel"
+PANEL_ARRAYS = ["codes", "dates", "data", "indices", "indptr", "shape"]
+
+
+def save_factor_panel(panel, path):
+    # written next to the old panel and swapped in, so a reader never sees half a panel
+    matrix = sparse.csr_matrix(panel.matrix)
+    matrix.sort_indices()
+    arrays = {"codes": panel.codes.astype(str), "dates": panel.dates.astype(str), "data": matrix.data,
+              "indices": matrix.indices, "indptr": matrix.indptr, "shape": np.array(matrix.shape)}
+    tmp_path = path.rstrip("/\\") + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    for name, values in arrays.items():
+        np.save(os.path.join(tmp_path, f"{name}.npy"), values)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+    return path
+
+
+def load_factor_panel(path, mmap=True):
+    arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r" if mmap else None)
+              for name in PANEL_ARRAYS}
+    matrix = sparse.csr_matrix((arrays["data"], arrays["indices"], arrays["indptr"]),
+                               shape=tuple(arrays["shape"]), copy=False)
+    return ScorePanel(arrays["codes"].astype(object), arrays["dates"].astype(object), matrix)
+
+
+def month_ends(panel):
+    # the panel cut down to the last date of every month
+    months = pd.to_datetime(pd.Series(panel.dates)).dt.to_period('M')
+    return panel.select_dates(months.groupby(months).tail(1).index.to_numpy())
+
+
+def stacked(panel, keep_zeros=False):
+    # long format (date, 股票代码, value) in date then stock order, like DataFrame.stack() of
+    # the old spreadsheets; keep_zeros also lists every stock without a value on a date
+    by_date = panel.matrix.T.tocsr()
+    if keep_zeros:
+        values = by_date.toarray()
+        dates, stocks = np.indices(values.shape)
+        dates, stocks, values = dates.ravel(), stocks.ravel(), values.ravel()
+    else:
+        by_date.eliminate_zeros()
+        by_date.sort_indices()
+        coo = by_date.tocoo()
+        dates, stocks, values = coo.row, coo.col, coo.data
+    parsed = pd.to_datetime(pd.Series(panel.dates)).to_numpy()
+    return pd.DataFrame({'date': parsed[dates],
+                         '股票代码': panel.codes[stocks].astype(str), 'value': values})
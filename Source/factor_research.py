@@ -0,0 +1,171 @@
+# factor_research.py
+# The evaluation steps of 11 (monthly standardized factor, RankIC) and 14 (layered backtest
+# against the index) as plain functions on DataFrames, so the scripts and the cached
+# pipeline in 28-research-pipeline.py compute exactly the same thing.
+
+import os
+from pathlib import Path
+import pandas as pd
+from scipy.stats import spearmanr
+from tqdm import tqdm
+from sklearn.preprocessing import StandardScaler
+from factor_panel import month_ends, stacked
+from market_data import settled_until
+
+LAYERS = 5
+
+
+def standardized_factor(panel):
+    # 11: each stock's last non-zero factor value of every month, z-scored per stock
+    df_factor = stacked(panel)
+    df_factor.columns = ['日期', '股票代码', '因子值']
+    df_factor['股票代码'] = df_factor['股票代码'].astype(str).str.zfill(6)
+    df_factor = df_factor.groupby(['股票代码', pd.Grouper(key='日期', freq='M')]).last().reset_index()
+    scaler = StandardScaler()
+    df_factor['因子值'] = df_factor.groupby('股票代码')['因子值'].transform(
+        lambda x: scaler.fit_transform(x.values.reshape(-1, 1)).flatten()
+    )
+    return df_factor
+
+
+def load_monthly_returns(return_dir, first_month='2008-01'):
+    # 11: monthly history csvs from 10; stocks whose history does not start in first_month
+    # are left out
+    all_returns = []
+    for file in tqdm(os.listdir(return_dir), desc="加载行情数据"):
+        if file.endswith(".csv"):
+            stock_code = file.split("_")[0]
+            file_path = os.path.join(return_dir, file)
+            try:
+                df = pd.read_csv(file_path, parse_dates=['日期'])
+                if df['日期'].dt.to_period('M').min() != pd.Period(first_month, freq='M'):
+                    continue
+                df['因子月份'] = df['日期'] - pd.offsets.MonthEnd(1)
+                df['股票代码'] = stock_code
+                all_returns.append(df[['因子月份', '股票代码', '涨跌幅']])
+            except Exception as e:
+                print(f"加载 {file} 失败: {str(e)}")
+    return pd.concat(all_returns) if all_returns else pd.DataFrame()
+
+
+def calculate_rankic(factor_df, return_df):
+    merged = pd.merge(
+        factor_df,
+        return_df,
+        left_on=['股票代码', '日期'],
+        right_on=['股票代码', '因子月份'],
+        how='inner'
+    ).dropna(subset=['因子值', '涨跌幅'])
+    results = []
+    for date, group in tqdm(merged.groupby('日期'), desc="计算RankIC"):
+        if len(group) < 2:
+            continue
+        ic, p_value = spearmanr(group['因子值'], group['涨跌幅'])
+        results.append({
+            '日期': date,
+            'RankIC': ic,
+            'p值': p_value,
+            '股票数量': len(group)
+        })
+    return pd.DataFrame(results)
+
+
+def layered_factor(panel, layers=LAYERS):
+    # 14: each stock's factor on the last date of every month, stocks ranked by its absolute
+    # value into `layers` groups that are held through the next month
+    factor_df = stacked(month_ends(panel), keep_zeros=True)
+    factor_df.columns = ['date', 'stock_id', 'factor']
+    factor_df['stock_id'] = factor_df['stock_id'].astype(str).str.zfill(6)
+    factor_df['month'] = factor_df['date'].dt.to_period('M')
+    monthly_factor = factor_df.sort_values('date').groupby(['stock_id', 'month']).last().reset_index()
+    monthly_factor['next_month'] = monthly_factor['month'] + 1
+    monthly_factor['factor_abs'] = monthly_factor['factor'].abs()
+    monthly_sorted = monthly_factor.sort_values(['month', 'factor_abs'], ascending=[True, False])
+    def assign_layer(group):
+        n = len(group)
+        size = n // layers
+        result = []
+        for i in range(n):
+            if i < (layers-1)*size:
+                layer = i // size
+            else:
+                layer = layers-1
+            result.append(layer)
+        return pd.Series(result, index=group.index)
+    monthly_sorted['layer'] = monthly_sorted.groupby('month', group_keys=False).apply(assign_layer)
+    return monthly_sorted[['stock_id', 'next_month', 'layer']]
+
+
+def load_daily_returns(return_dir):
+    # 14: per-stock history csvs, one row per trading day (or month) with its 涨跌幅 in %
+    all_returns = []
+    for f in Path(return_dir).glob('*.csv'):
+        stock_id = f.stem.split('_')[0].zfill(6)
+        df_return = pd.read_csv(f, parse_dates=['日期'], usecols=['日期', '涨跌幅'])
+        df_return.columns = ['date', 'return']
+        df_return['stock_id'] = stock_id
+        df_return['month'] = df_return['date'].dt.to_period('M')
+        all_returns.append(df_return)
+    return pd.concat(all_returns)
+
+
+def merge_layers(monthly_factor, return_df):
+    return pd.merge(
+        monthly_factor,
+        return_df,
+        left_on=['stock_id', 'next_month'],
+        right_on=['stock_id', 'month'],
+        how='inner'
+    )
+
+
+def index_range(start, end):
+    # index days a backtest of start..end needs: a month of margin before it for the first
+    # return, a quarter after it for the months the layers are held, and nothing that is not
+    # settled yet, so a rerun is answered from the market-data cache alone
+    first = pd.Timestamp(start) - pd.Timedelta(days=62)
+    last = min(pd.Timestamp(end) + pd.Timedelta(days=92), settled_until("daily"))
+    return first.strftime("%Y-%m-%d"), last.strftime("%Y-%m-%d")
+
+
+def panel_range(panel):
+    # first and last date of a factor panel, for index_range
+    dates = pd.to_datetime(pd.Series(panel.dates))
+    return dates.min(), dates.max()
+
+
+def index_monthly_returns(index_daily):
+    # index_daily: daily index bars with date and close columns
+    index_daily = index_daily.copy()
+    index_daily['date'] = pd.to_datetime(index_daily['date'])
+    index_daily.set_index('date', inplace=True)
+    monthly_last = index_daily.resample('M').last()
+    monthly_last['monthly_return'] = monthly_last['close'].pct_change()
+    monthly_last['month'] = monthly_last.index.to_period('M')
+    monthly_last = monthly_last[~monthly_last.index.duplicated(keep='last')]
+    monthly_last = monthly_last.dropna(subset=['monthly_return'])
+    return monthly_last.set_index('month')['monthly_return']
+
+
+def calculate_excess_returns(df, index_returns):
+    stock_monthly_returns = (
+        df.groupby(['stock_id', 'month'])['return']
+        .apply(lambda x: (1 + x/100).prod() - 1)
+        .reset_index()
+        .rename(columns={'return': 'monthly_return'})
+    )
+    layer_info = df[['stock_id', 'month', 'layer']].drop_duplicates()
+    merged_returns = pd.merge(stock_monthly_returns, layer_info, on=['stock_id', 'month'], how='left')
+    layer_monthly = merged_returns.groupby(['month', 'layer'])['monthly_return'].mean().unstack()
+    common_months = layer_monthly.index.intersection(index_returns.index)
+    layer_monthly = layer_monthly.loc[common_months]
+    index_returns = index_returns.loc[common_months]
+    excess_returns = layer_monthly.sub(index_returns, axis=0)
+    cumulative_returns = (1 + excess_returns).cumprod() - 1
+    return excess_returns, cumulative_returns
+
+
+def drop_last_month(df):
+    # the last month in the data is usually incomplete
+    all_months = pd.Series(df['month'].unique()).sort_values()
+    return df[df['month'].isin(all_months[:-1])]
@@ -0,0 +1,177 @@
+# factor_state.py
+# Persisted state for updating the 09 factor incrementally. The state directory holds the
+# sparse score panel seen so far (scores.npz), the factor history as one long-format parquet
+# file per month (factor/YYYY-MM.parquet: Date, 股票代码, Score, non-zero cells only) and a
+# meta.json naming the weights and daily score reducer it was built with.
+#
+# The factor of a date only depends on the window of report dates ending there. When the
+# scores of some dates are (re)loaded, only the factor from the first changed date through the
+# window-1 dates after the last one can change, so only that slice is recomputed from the
+# window before it and rewritten. The numbers are the same as a full rebuild; check_rebuild
+# compares the two.
+
+import hashlib
+import json
+import os
+import shutil
+import time
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from corpus_io import write_json_atomic
+from factor_engine import decayed_panel, decayed_scores
+from score_panel import ScorePanel, from_triples
+
+FACTOR_DIR = "factor_state"
+HISTORY_COLUMNS = ['Date', '股票代码', 'Score']
+
+
+def state_key(weights, reducer):
+    return hashlib.blake2b(json.dumps([list(weights), reducer]).encode(), digest_size=8).hexdigest()
+
+
+def save_panel(panel, path):
+    matrix = panel.matrix
+    tmp_path = path + ".tmp.npz"
+    np.savez(tmp_path, codes=panel.codes.astype(str), dates=panel.dates.astype(str), data=matrix.data,
+             indices=matrix.indices, indptr=matrix.indptr, shape=np.array(matrix.shape))
+    os.replace(tmp_path, path)
+
+
+def load_panel_file(path):
+    with np.load(path) as f:
+        matrix = sparse.csr_matrix((f["data"], f["indices"], f["indptr"]), shape=tuple(f["shape"]))
+        return ScorePanel(f["codes"].astype(object), f["dates"].astype(object), matrix)
+
+
+def replace_dates(panel, update, first_date, last_date):
+    # every cell dated first_date..last_date now comes from update; a date left with no
+    # scores drops out of the axis, as it would in a full rebuild
+    old = panel.matrix.tocoo()
+    old_dates = panel.dates[old.col]
+    keep = (old_dates < first_date) | (old_dates > last_date)
+    new = update.matrix.tocoo()
+    return from_triples(np.concatenate([panel.codes[old.row[keep]], update.codes[new.row]]),
+                        np.concatenate([old_dates[keep], update.dates[new.col]]),
+                        np.concatenate([old.data[keep], new.data]))
+
+
+def month_of(date):
+    return str(date)[:7]
+
+
+class FactorState:
+    def __init__(self, root, weights, reducer="mean"):
+        self.root = root
+        self.weights = list(weights)
+        self.reducer = reducer
+        self.meta_path = os.path.join(root, "meta.json")
+        self.panel_path = os.path.join(root, "scores.npz")
+        self.history_dir = os.path.join(root, "factor")
+        self.panel = None
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta["state_key"] != state_key(self.weights, reducer):
+                raise ValueError(f"{root} was built with other weights or reducer (window {meta['window']}, "
+                                 f"reducer {meta['reducer']}), "
+                                 f"rebuild it or use another directory")
+            self.panel = load_panel_file(self.panel_path)
+
+    @property
+    def empty(self):
+        return self.panel is None
+
+    def _recompute(self, panel, first, last):
+        # factor of date columns first..last-1, from the window-1 columns before them on
+        start = max(0, first - (len(self.weights) - 1))
+        return decayed_scores(panel.matrix[:, start:last].toarray(), self.weights)[:, first - start:]
+
+    def _rewrite(self, panel, first, last, removed):
+        # a month of dates at a time, so only one month of the factor is ever dense
+        months = np.array([month_of(d) for d in panel.dates[first:last]])
+        for month in sorted(set(months)):
+            begin, end = first + np.flatnonzero(months == month)[[0, -1]]
+            self._write_history(panel.dates[begin:end + 1], panel.codes,
+                                self._recompute(panel, begin, end + 1), removed)
+            removed = set()
+        if first == last and removed:
+            self._write_history([], panel.codes, np.zeros((len(panel.codes), 0)), removed)
+
+    def rebuild(self, panel):
+        shutil.rmtree(self.history_dir, ignore_errors=True)
+        self._rewrite(panel, 0, len(panel.dates), set())
+        self._save(panel)
+        return len(panel.dates)
+
+    def update(self, scores, first_date, last_date):
+        # scores holds everything now known for first_date..last_date; returns the dates
+        # whose factor was recomputed
+        before = set(self.panel.dates)
+        panel = replace_dates(self.panel, scores, first_date, last_date)
+        removed = before - set(panel.dates)
+        changed = [d for d in panel.dates if first_date <= d <= last_date] + sorted(removed)
+        if not changed:
+            return []
+        window = len(self.weights)
+        first = int(np.searchsorted(panel.dates, min(changed)))
+        last = min(int(np.searchsorted(panel.dates, max(changed), 'right')) + window - 1, len(panel.dates))
+        self._rewrite(panel, first, last, removed)
+        self._save(panel)
+        return list(panel.dates[first:last])
+
+    def _save(self, panel):
+        os.makedirs(self.root, exist_ok=True)
+        save_panel(panel, self.panel_path)
+        write_json_atomic({"window": len(self.weights), "reducer": self.reducer,
+                       "state_key": state_key(self.weights, self.reducer),
+                       "stocks": len(panel.codes), "dates": len(panel.dates), "scores": int(panel.nnz),
+                       "last_date": str(panel.dates[-1]) if len(panel.dates) else None,
+                       "updated": time.strftime("%Y-%m-%d %H:%M:%S")}, self.meta_path)
+        self.panel = panel
+
+    def _write_history(self, dates, codes, factor, removed):
+        # factor is stocks x dates, dense or sparse; each month file touched is rewritten whole
+        factor = sparse.coo_matrix(factor)
+        nonzero = factor.data != 0
+        fresh = pd.DataFrame({'Date': np.asarray(dates, dtype=object)[factor.col[nonzero]].astype(str),
+                              '股票代码': np.asarray(codes, dtype=object)[factor.row[nonzero]].astype(str),
+                              'Score': factor.data[nonzero]})
+        replaced = set(str(d) for d in dates) | set(str(d) for d in removed)
+        os.makedirs(self.history_dir, exist_ok=True)
+        for month in sorted(set(month_of(d) for d in replaced)):
+            old = self.history(month)
+            df = pd.concat([old[~old['Date'].isin(replaced)], fresh[fresh['Date'].str[:7] == month]],
+                           ignore_index=True).sort_values(['Date', '股票代码'], kind="stable")
+            path = os.path.join(self.history_dir, f"{month}.parquet")
+            tmp_path = path + ".tmp"
+            df.to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, path)
+
+    def history(self, month=None):
+        # long-format factor values of one month, or of every month
+        if month is not None:
+            path = os.path.join(self.history_dir, f"{month}.parquet")
+            return pd.read_parquet(path) if os.path.exists(path) else pd.DataFrame(columns=HISTORY_COLUMNS)
+        if not os.path.isdir(self.history_dir):
+            return pd.DataFrame(columns=HISTORY_COLUMNS)
+        months = sorted(name[:-len(".parquet")] for name in os.listdir(self.history_dir) if name.endswith(".parquet"))
+        frames = [self.history(month) for month in months]
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=HISTORY_COLUMNS)
+
+    def factor_panel(self):
+        # the history on the state's own stock and date axes, as 09 would have built it
+        history = self.history()
+        rows = pd.Index(self.panel.codes).get_indexer(history['股票代码'])
+        cols = pd.Index(self.panel.dates).get_indexer(history['Date'])
+        matrix = sparse.csr_matrix((history['Score'].to_numpy(dtype=np.float64), (rows, cols)),
+                                   shape=self.panel.shape)
+        return ScorePanel(self.panel.codes, self.panel.dates, matrix)
+
+
+def check_rebuild(state):
+    # largest difference between the state's history and the factor rebuilt from its scores
+    # in one go; 0.0 when the incremental updates are exact
+    rebuilt = decayed_panel(state.panel, state.weights).matrix
+    diff = abs(state.factor_panel().matrix - rebuilt)
+    return float(diff.max()) if diff.nnz else 0.0
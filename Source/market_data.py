@@ -0,0 +1,225 @@
+# market_data.py
+# Price history for 10/14/28 behind a local cache. Every (symbol, period) is one parquet file
+# under <root>/<period>/ plus a small json of the date ranges already fetched, so a request
+# only goes to the network for the part of its range that is not held yet. Fetches run in a
+# bounded thread pool behind a shared rate limit and are retried with backoff. The source is
+# pluggable: AkshareSource for real data, CsvSource as a local stand-in.
+#
+# Rows are indexed by 日期 and carry at least 收盘 and 涨跌幅 (in %), for stocks and indexes alike.
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import pandas as pd
+from corpus_io import write_json_atomic
+
+MARKET_DIR = "market_data"
+PERIODS = ["daily", "monthly"]
+WORKERS = 8
+RATE = 5.0
+RETRIES = 3
+
+
+def _day(value):
+    return pd.Timestamp(value).normalize()
+
+
+def is_index(symbol):
+    # akshare index symbols carry their exchange, stock codes are six digits
+    return symbol[:2] in ("sh", "sz")
+
+
+class AkshareSource:
+    def fetch(self, symbol, start, end, period):
+        import akshare as ak
+        if is_index(symbol):
+            # the index endpoint only serves whole daily histories
+            df = ak.stock_zh_index_daily(symbol=symbol).rename(columns={'date': '日期', 'close': '收盘'})
+            df['日期'] = pd.to_datetime(df['日期'])
+            df = df.set_index('日期').sort_index()
+            if period == "monthly":
+                # the month's last trading day, the date stock_zh_a_hist gives monthly bars
+                df = df.dropna(subset=['收盘'])
+                df = df.groupby(df.index.to_period('M')).tail(1)
+            df['涨跌幅'] = df['收盘'].pct_change() * 100
+            df = df.reset_index()
+        else:
+            df = ak.stock_zh_a_hist(symbol=symbol, period=period, start_date=start.strftime("%Y%m%d"),
+                                    end_date=end.strftime("%Y%m%d"), adjust="")
+            df = df.drop(columns=['股票代码'], errors='ignore')
+            df['日期'] = pd.to_datetime(df['日期'])
+        return df[(df['日期'] >= start) & (df['日期'] <= end)]
+
+
+class CsvSource:
+    # <root>/<period>/<symbol>.csv with a 日期 column; counts its calls so tests can check
+    # what was actually fetched
+    def __init__(self, root):
+        self.root = root
+        self.calls = []
+
+    def fetch(self, symbol, start, end, period):
+        self.calls.append((symbol, start, end, period))
+        path = os.path.join(self.root, period, f"{symbol}.csv")
+        if not os.path.exists(path):
+            return pd.DataFrame(columns=['日期', '收盘', '涨跌幅'])
+        df = pd.read_csv(path, parse_dates=['日期'], dtype={'股票代码': str})
+        return df[(df['日期'] >= start) & (df['日期'] <= end)]
+
+
+SOURCES = {"akshare": AkshareSource, "csv": CsvSource}
+
+
+def open_source(name, path=None):
+    return CsvSource(path) if name == "csv" else SOURCES[name]()
+
+
+class RateLimiter:
+    # at most `rate` calls a second across all threads, spaced evenly
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self.lock = threading.Lock()
+        self.next_time = 0.0
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_time)
+            self.next_time = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+def merge_ranges(ranges):
+    merged = []
+    for start, end in sorted(tuple(r) for r in ranges):
+        if merged and start <= merged[-1][1] + pd.Timedelta(days=1):
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def missing_ranges(held, start, end):
+    # the parts of start..end not covered by the held ranges
+    missing = []
+    cursor = start
+    for held_start, held_end in merge_ranges(held):
+        if held_end < cursor:
+            continue
+        if held_start > end:
+            break
+        if held_start > cursor:
+            missing.append((cursor, held_start - pd.Timedelta(days=1)))
+        cursor = max(cursor, held_end + pd.Timedelta(days=1))
+    if cursor <= end:
+        missing.append((cursor, end))
+    return missing
+
+
+def settled_until(period, today=None):
+    # the last date whose bar can no longer change: yesterday, or the end of last month
+    today = _day(today or pd.Timestamp.now())
+    if period == "monthly":
+        return today.replace(day=1) - pd.Timedelta(days=1)
+    return today - pd.Timedelta(days=1)
+
+
+class MarketData:
+    def __init__(self, root=MARKET_DIR, source=None, workers=WORKERS, rate=RATE, retries=RETRIES):
+        self.root = root
+        self.source = source or AkshareSource()
+        self.workers = workers
+        self.limiter = RateLimiter(rate)
+        self.retries = retries
+        self.locks = {}
+        self.locks_lock = threading.Lock()
+
+    def _paths(self, symbol, period):
+        base = os.path.join(self.root, period, symbol)
+        return base + ".parquet", base + ".json"
+
+    def _lock(self, symbol, period):
+        with self.locks_lock:
+            return self.locks.setdefault((symbol, period), threading.Lock())
+
+    def held(self, symbol, period="daily"):
+        _, ranges_path = self._paths(symbol, period)
+        if not os.path.exists(ranges_path):
+            return []
+        with open(ranges_path, encoding="utf-8") as f:
+            return [(_day(start), _day(end)) for start, end in json.load(f)["ranges"]]
+
+    def cached(self, symbol, period="daily"):
+        data_path, _ = self._paths(symbol, period)
+        if not os.path.exists(data_path):
+            return pd.DataFrame(columns=['收盘', '涨跌幅'], index=pd.DatetimeIndex([], name='日期'))
+        return pd.read_parquet(data_path)
+
+    def _fetch(self, symbol, start, end, period):
+        for attempt in range(self.retries + 1):
+            self.limiter.wait()
+            try:
+                return self.source.fetch(symbol, start, end, period)
+            except Exception as e:
+                if attempt == self.retries:
+                    raise
+                print(f"{symbol} {start.date()}~{end.date()} failed ({str(e)}), retrying")
+                time.sleep(2 ** attempt)
+
+    def update(self, symbol, start, end, period="daily"):
+        # fetches whatever part of start..end is not held yet; returns how many requests it took
+        start, end = _day(start), _day(end)
+        with self._lock(symbol, period):
+            held = self.held(symbol, period)
+            missing = missing_ranges(held, start, end)
+            if not missing:
+                return 0
+            frames = [self._fetch(symbol, first, last, period) for first, last in missing]
+            fresh = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+            data = self.cached(symbol, period)
+            if not fresh.empty:
+                fresh = fresh.set_index('日期')
+                # a monthly bar is dated by its last trading day so far, which moves while the
+                # month is still open: fresh bars replace whatever is held for their month
+                if period == "monthly":
+                    stale = data.index.to_period('M').isin(fresh.index.to_period('M'))
+                else:
+                    stale = data.index.isin(fresh.index)
+                data = pd.concat([data[~stale], fresh]).sort_index()
+            # a range reaching into bars that can still change is only held up to the last settled day
+            settled = settled_until(period)
+            held = held + [(first, min(last, settled)) for first, last in missing if first <= settled]
+            data_path, ranges_path = self._paths(symbol, period)
+            os.makedirs(os.path.dirname(data_path), exist_ok=True)
+            tmp_path = data_path + ".tmp"
+            data.to_parquet(tmp_path)
+            os.replace(tmp_path, data_path)
+            write_json_atomic({"ranges": [[str(s.date()), str(e.date())] for s, e in merge_ranges(held)]},
+                              ranges_path)
+            return len(missing)
+
+    def cached_range(self, symbol, start, end, period="daily"):
+        # what the cache holds for start..end, without going to the network
+        data = self.cached(symbol, period)
+        return data[(data.index >= _day(start)) & (data.index <= _day(end))]
+
+    def history(self, symbol, start, end, period="daily"):
+        self.update(symbol, start, end, period)
+        return self.cached_range(symbol, start, end, period)
+
+    def refresh(self, symbols, start, end, period="daily"):
+        # brings every symbol up to date concurrently; returns {symbol: requests made or error}
+        results = {}
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = {pool.submit(self.update, symbol, start, end, period): symbol for symbol in symbols}
+            for future in as_completed(futures):
+                symbol = futures[future]
+                try:
+                    results[symbol] = future.result()
+                except Exception as e:
+                    print(f"failed in {symbol} : {str(e)}")
+                    results[symbol] = e
+        return results
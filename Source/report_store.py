@@ -0,0 +1,306 @@
+# report_store.py
+# Report corpus access for the pipeline scripts, backed by MongoDB or by a
+# Parquet store partitioned as <table>/年份=YYYY/月份=MM/part-0.parquet.
+# Each month is one file, so replacing a month is a single atomic rename.
+
+import os
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from corpus_io import load_touched, write_touched
+
+MONGO_URI = "mongodb://localhost:27017/"
+STORE_DIR = r"D:\Projects\report-store"
+BACKENDS = ["mongo", "parquet"]
+
+RAW_TABLE = "reports"
+PROCESSED_TABLE = "processed_reports"
+SENTENCE_TABLE = "sentence_predictions"
+
+MONGO_COLLECTIONS = {
+    RAW_TABLE: ("stock_reports_db", "reports"),
+    PROCESSED_TABLE: ("processed_stock_reports_db", "processed_reports"),
+    SENTENCE_TABLE: ("sentiment_analysis_v2_db", "sentence_predictions"),
+}
+
+# every extraction is a 发布日期 range, so the date leads; with the code and score in the key
+# the daily score aggregation is answered from the index without reading a document
+MONGO_INDEXES = {
+    PROCESSED_TABLE: [[("发布日期", 1), ("股票代码", 1), ("综合得分", 1)]],
+}
+REDUCERS = ["mean", "sum", "count", "max", "min"]
+DAILY_SCORE_COLUMNS = ["股票代码", "发布日期", "综合得分", "报告数"]
+_MONGO_REDUCERS = {"mean": "$avg", "sum": "$sum", "max": "$max", "min": "$min"}
+
+_REPORT_FIELDS = [
+    pa.field("股票代码", pa.string()),
+    pa.field("券商简称", pa.string()),
+    pa.field("发布日期", pa.date32()),
+    pa.field("研报标题", pa.string()),
+    pa.field("报告链接", pa.string()),
+]
+SCHEMAS = {
+    RAW_TABLE: pa.schema(_REPORT_FIELDS + [
+        pa.field("研报文本", pa.string()),
+        pa.field("研究员", pa.string()),
+    ]),
+    PROCESSED_TABLE: pa.schema(_REPORT_FIELDS + [
+        pa.field("研报文本", pa.list_(pa.string())),
+        pa.field("研究员", pa.string()),
+        pa.field("综合得分", pa.float64()),
+    ]),
+    SENTENCE_TABLE: pa.schema([
+        pa.field("股票代码", pa.string()),
+        pa.field("发布日期", pa.date32()),
+        pa.field("研报标题", pa.string()),
+        pa.field("原始文本", pa.string()),
+        pa.field("句子序号", pa.int32()),
+        pa.field("预测结果", pa.string()),
+        pa.field("原始正面概率", pa.float64()),
+        pa.field("调整后得分", pa.float64()),
+        pa.field("关联文档ID", pa.string()),
+    ]),
+}
+PARTITION_KEYS = ["年份", "月份"]
+PARTITIONING = ds.partitioning(pa.schema([(k, pa.string()) for k in PARTITION_KEYS]), flavor="hive")
+PARTITION_FILE = "part-0.parquet"
+ROW_GROUP_SIZE = 10000
+
+
+def to_date(value):
+    return pd.Timestamp(value).date()
+
+
+def months_between(start_date, end_date):
+    periods = pd.period_range(pd.Timestamp(start_date), pd.Timestamp(end_date), freq="M")
+    return [(f"{p.year}", f"{p.month:02d}") for p in periods]
+
+
+def partition_path(root, table, year, month):
+    return os.path.join(root, table, f"年份={year}", f"月份={month}", PARTITION_FILE)
+
+
+def list_months(root, table):
+    months = []
+    table_dir = os.path.join(root, table)
+    if not os.path.isdir(table_dir):
+        return months
+    for year_dir in sorted(os.listdir(table_dir)):
+        for month_dir in sorted(os.listdir(os.path.join(table_dir, year_dir))):
+            if os.path.exists(os.path.join(table_dir, year_dir, month_dir, PARTITION_FILE)):
+                months.append((year_dir.split("=")[1], month_dir.split("=")[1]))
+    return months
+
+
+def _format_dates(df):
+    if "发布日期" in df.columns:
+        df["发布日期"] = pd.to_datetime(df["发布日期"]).dt.strftime("%Y-%m-%d")
+    return df
+
+
+def write_month(root, table, year, month, df):
+    schema = SCHEMAS[table]
+    df = df.reindex(columns=schema.names)
+    df["发布日期"] = pd.to_datetime(df["发布日期"]).dt.date
+    # sorted by code so row-group statistics can prune stock-code filters
+    df = df.sort_values(["股票代码", "发布日期"], kind="stable", na_position="last")
+    arrow_table = pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+    path = partition_path(root, table, year, month)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    pq.write_table(arrow_table, tmp_path, row_group_size=ROW_GROUP_SIZE)
+    os.replace(tmp_path, path)
+    return len(df)
+
+
+def read_month(root, table, year, month, columns=None):
+    path = partition_path(root, table, year, month)
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=columns or SCHEMAS[table].names)
+    return _format_dates(pq.read_table(path, columns=columns).to_pandas())
+
+
+def append_month(root, table, year, month, df):
+    existing = read_month(root, table, year, month)
+    if not existing.empty:
+        df = pd.concat([existing, df], ignore_index=True)
+    return write_month(root, table, year, month, df)
+
+
+def records(df):
+    df = df.astype(object).where(df.notna(), None)
+    rows = df.to_dict("records")
+    for row in rows:
+        for key, value in row.items():
+            if hasattr(value, "tolist"):
+                row[key] = value.tolist()
+    return rows
+
+
+class ParquetReportStore:
+    def __init__(self, table, root=STORE_DIR):
+        self.table = table
+        self.root = root
+
+    def _dataset(self):
+        return ds.dataset(os.path.join(self.root, self.table), format="parquet", partitioning=PARTITIONING)
+
+    def _filter(self, start_date, end_date, stock_codes):
+        expr = None
+        if start_date is not None or end_date is not None:
+            # the 年份/月份 terms prune whole partitions before any file is opened
+            first = start_date if start_date is not None else "2000-01-01"
+            last = end_date if end_date is not None else pd.Timestamp.today()
+            by_year = {}
+            for year, month in months_between(first, last):
+                by_year.setdefault(year, []).append(month)
+            for year, months in by_year.items():
+                term = (ds.field("年份") == year) & ds.field("月份").isin(months)
+                expr = term if expr is None else expr | term
+            if start_date is not None:
+                expr = expr & (ds.field("发布日期") >= to_date(start_date))
+            if end_date is not None:
+                expr = expr & (ds.field("发布日期") <= to_date(end_date))
+        if stock_codes is not None:
+            code_expr = ds.field("股票代码").isin([str(c) for c in stock_codes])
+            expr = code_expr if expr is None else expr & code_expr
+        return expr
+
+    def frame(self, start_date=None, end_date=None, stock_codes=None, columns=None, sort=False):
+        if not os.path.isdir(os.path.join(self.root, self.table)):
+            return pd.DataFrame(columns=columns or SCHEMAS[self.table].names)
+        table = self._dataset().to_table(columns=columns, filter=self._filter(start_date, end_date, stock_codes))
+        df = table.to_pandas()
+        if sort and "发布日期" in df.columns:
+            df = df.sort_values("发布日期", kind="stable")
+        return _format_dates(df)
+
+    def find(self, start_date=None, end_date=None, stock_codes=None, columns=None, sort=False):
+        return iter(records(self.frame(start_date, end_date, stock_codes, columns, sort)))
+
+    def count(self, start_date=None, end_date=None):
+        if not os.path.isdir(os.path.join(self.root, self.table)):
+            return 0
+        return self._dataset().count_rows(filter=self._filter(start_date, end_date, None))
+
+    def distinct(self, field, start_date=None, end_date=None):
+        df = self.frame(start_date, end_date, columns=[field])
+        return df[field].dropna().unique().tolist()
+
+    def daily_scores(self, start_date=None, end_date=None, reducer="mean"):
+        # one row per (股票代码, 发布日期): the reports' 综合得分 reduced, and how many there were
+        df = self.frame(start_date, end_date, columns=["股票代码", "发布日期", "综合得分"])
+        grouped = df.dropna(subset=["综合得分"]).groupby(["股票代码", "发布日期"], sort=False)["综合得分"]
+        daily = grouped.agg(reducer).to_frame("综合得分")
+        daily["报告数"] = grouped.size()
+        return daily.reset_index().reindex(columns=DAILY_SCORE_COLUMNS)
+
+    def update_scores(self, scores):
+        # scores: DataFrame of 报告链接, 发布日期, 综合得分
+        dates = pd.to_datetime(scores["发布日期"])
+        for (year, month), group in scores.groupby([dates.dt.strftime("%Y"), dates.dt.strftime("%m")]):
+            df = read_month(self.root, self.table, year, month)
+            updated = group.set_index("报告链接")["综合得分"]
+            hit = df["报告链接"].isin(updated.index)
+            df.loc[hit, "综合得分"] = df.loc[hit, "报告链接"].map(updated)
+            write_month(self.root, self.table, year, month, df)
+
+
+class MongoReportStore:
+    def __init__(self, table, uri=MONGO_URI):
+        import pymongo
+        self.table = table
+        self.client = pymongo.MongoClient(uri)
+        db_name, collection_name = MONGO_COLLECTIONS[table]
+        self.collection = self.client[db_name][collection_name]
+        for keys in MONGO_INDEXES.get(table, []):
+            self.collection.create_index(keys)
+
+    def _query(self, start_date, end_date, stock_codes):
+        query = {}
+        if start_date is not None or end_date is not None:
+            query["发布日期"] = {}
+            if start_date is not None:
+                query["发布日期"]["$gte"] = start_date
+            if end_date is not None:
+                query["发布日期"]["$lte"] = end_date
+        if stock_codes is not None:
+            query["股票代码"] = {"$in": list(stock_codes)}
+        return query
+
+    def find(self, start_date=None, end_date=None, stock_codes=None, columns=None, sort=False):
+        projection = dict.fromkeys(columns, 1) if columns else None
+        cursor = self.collection.find(self._query(start_date, end_date, stock_codes), projection)
+        if sort:
+            cursor = cursor.sort("发布日期", 1)
+        return cursor
+
+    def frame(self, start_date=None, end_date=None, stock_codes=None, columns=None, sort=False):
+        df = pd.DataFrame(list(self.find(start_date, end_date, stock_codes, columns, sort)))
+        if columns:
+            df = df.reindex(columns=columns)
+        return df
+
+    def count(self, start_date=None, end_date=None):
+        return self.collection.count_documents(self._query(start_date, end_date, None))
+
+    def distinct(self, field, start_date=None, end_date=None):
+        return self.collection.distinct(field, self._query(start_date, end_date, None))
+
+    def daily_scores(self, start_date=None, end_date=None, reducer="mean"):
+        # grouped server-side, so only one small row per (股票代码, 发布日期) crosses the wire
+        query = self._query(start_date, end_date, None)
+        query["综合得分"] = {"$type": "number"}
+        value = {"$sum": 1} if reducer == "count" else {_MONGO_REDUCERS[reducer]: "$综合得分"}
+        pipeline = [
+            {"$match": query},
+            {"$project": {"_id": 0, "股票代码": 1, "发布日期": 1, "综合得分": 1}},
+            {"$group": {"_id": {"股票代码": "$股票代码", "发布日期": "$发布日期"},
+                        "综合得分": value, "报告数": {"$sum": 1}}},
+            {"$project": {"_id": 0, "股票代码": "$_id.股票代码", "发布日期": "$_id.发布日期",
+                          "综合得分": 1, "报告数": 1}},
+        ]
+        df = pd.DataFrame(list(self.collection.aggregate(pipeline, allowDiskUse=True)))
+        return df.reindex(columns=DAILY_SCORE_COLUMNS)
+
+
+def find_by_ids(collection, ids=None, batch_size=10000):
+    if ids is None:
+        yield from collection.find()
+        return
+    for start in range(0, len(ids), batch_size):
+        yield from collection.find({"_id": {"$in": ids[start:start + batch_size]}})
+
+
+def touched_scope(touched_path):
+    # the touched file written by 03: document _ids (mongo) or YYYY-MM partitions (parquet)
+    if touched_path is None:
+        return None, None
+    touched = load_touched(touched_path)
+    ids = months = None
+    if "ids" in touched:
+        from bson import ObjectId
+        ids = [ObjectId(i) for i in touched["ids"]]
+    if "months" in touched:
+        months = [tuple(m.split("-")) for m in touched["months"]]
+    return ids, months
+
+
+def consume_touched(touched_path, ids, months):
+    # run by the last stage that needs the touched file, once its work is done; anything 03
+    # added in the meantime stays listed
+    if touched_path is None:
+        return
+    touched = load_touched(touched_path)
+    done = {"ids": set(str(i) for i in ids or []), "months": set("-".join(m) for m in months or [])}
+    write_touched({key: [v for v in values if v not in done.get(key, set())]
+                   for key, values in touched.items()}, touched_path)
+
+
+def open_store(backend, table, store_dir=STORE_DIR):
+    if backend == "parquet":
+        return ParquetReportStore(table, store_dir)
+    if backend == "mongo":
+        return MongoReportStore(table)
+    raise ValueError(f"unknown backend : {backend}")
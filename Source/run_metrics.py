@@ -0,0 +1,171 @@
+# run_metrics.py
+# Always-on stage timing for the scoring run. Every instrumented stage keeps a cumulative
+# time, call count and item count in one process-wide registry; an exporter thread writes
+# snapshots (with RSS, progress and ETA) to a Prometheus text file or appends them to a
+# JSONL file. A measurement is two perf_counter calls and a locked add, and stages are
+# timed per pool or batch, so leaving it on costs nothing measurable.
+
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+METRICS_FILE = "scoring_metrics.jsonl"
+EXPORT_INTERVAL = 30
+
+
+def rss_bytes():
+    # current RSS, or None where the platform offers no way to read it
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        return None
+
+
+def peak_rss_bytes():
+    # resource is Unix only; ru_maxrss is KiB on Linux and bytes on macOS. Windows reports
+    # its peak working set through psutil
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+    except ImportError:
+        pass
+    try:
+        import psutil
+        return getattr(psutil.Process().memory_info(), "peak_wset", None)
+    except ImportError:
+        return None
+
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stages = {}
+        self.started = time.time()
+        self.done = 0
+        self.total = None
+
+    def add(self, stage, seconds, items=1):
+        with self.lock:
+            entry = self.stages.get(stage)
+            if entry is None:
+                entry = self.stages[stage] = [0.0, 0, 0]
+            entry[0] += seconds
+            entry[1] += 1
+            entry[2] += items
+
+    @contextmanager
+    def stage(self, stage, items=1):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start, items)
+
+    def timed_iter(self, iterable, stage):
+        # times each next() of a cursor, not the caller's work between them
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add(stage, time.perf_counter() - start, 0)
+                return
+            self.add(stage, time.perf_counter() - start)
+            yield item
+
+    def progress(self, done=1):
+        with self.lock:
+            self.done += done
+
+    def set_total(self, total):
+        self.total = total
+
+    def snapshot(self):
+        with self.lock:
+            stages = {name: list(entry) for name, entry in self.stages.items()}
+            done = self.done
+        elapsed = time.time() - self.started
+        rate = done / elapsed if elapsed else 0.0
+        snapshot = {
+            "time": round(time.time(), 1), "pid": os.getpid(), "elapsed_seconds": round(elapsed, 1),
+            "rss_bytes": rss_bytes(), "peak_rss_bytes": peak_rss_bytes(),
+            "reports_done": done, "reports_total": self.total, "reports_per_sec": round(rate, 3),
+            "eta_seconds": round((self.total - done) / rate, 0) if self.total and rate else None,
+            "stages": {},
+        }
+        for name, (seconds, calls, items) in sorted(stages.items()):
+            snapshot["stages"][name] = {
+                "seconds": round(seconds, 3), "calls": calls, "items": items,
+                "items_per_sec": round(items / seconds, 2) if seconds else None,
+                "share": round(seconds / elapsed, 4) if elapsed else None,
+            }
+        return snapshot
+
+
+metrics = Metrics()
+
+
+def prometheus_text(snapshot, prefix="scoring"):
+    label = f'pid="{snapshot["pid"]}"'
+    lines = []
+    for name, kind, key in [("stage_seconds_total", "counter", "seconds"), ("stage_calls_total", "counter", "calls"),
+                            ("stage_items_total", "counter", "items")]:
+        lines.append(f"# TYPE {prefix}_{name} {kind}")
+        for stage, values in snapshot["stages"].items():
+            lines.append(f'{prefix}_{name}{{{label},stage="{stage}"}} {values[key]}')
+    for name, key in [("rss_bytes", "rss_bytes"), ("peak_rss_bytes", "peak_rss_bytes"),
+                      ("reports_done", "reports_done"), ("reports_total", "reports_total"),
+                      ("eta_seconds", "eta_seconds"), ("elapsed_seconds", "elapsed_seconds")]:
+        if snapshot[key] is not None:
+            lines.append(f"# TYPE {prefix}_{name} gauge")
+            lines.append(f"{prefix}_{name}{{{label}}} {snapshot[key]}")
+    return "\n".join(lines) + "\n"
+
+
+def export(path, registry=metrics):
+    # .prom files are replaced whole (node_exporter textfile style), anything else is JSONL
+    snapshot = registry.snapshot()
+    if path.endswith(".prom"):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(prometheus_text(snapshot))
+        os.replace(tmp_path, path)
+    else:
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(snapshot) + "\n")
+    return snapshot
+
+
+class MetricsExporter:
+    def __init__(self, path, interval=EXPORT_INTERVAL, registry=metrics):
+        self.path = path
+        self.interval = interval
+        self.registry = registry
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            export(self.path, self.registry)
+
+    def __enter__(self):
+        if self.path:
+            self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self.path:
+            self.stopped.set()
+            self.thread.join()
+            export(self.path, self.registry)
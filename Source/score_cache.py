@@ -0,0 +1,153 @@
+# score_cache.py
+# Sentence score cache for 07/18: boilerplate and reposted sentences are scored once.
+# Entries are keyed by a hash of the whitespace-normalized sentence and stored under a
+# fingerprint of the model, tokenizer and max length, so a retrained model never reads
+# another model's scores. A small in-process LRU sits in front of the SQLite file.
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from run_metrics import metrics
+
+SCORE_CACHE = r"D:\Projects\report-analysis\score_cache.sqlite"
+LRU_SIZE = 200000
+BLOCK_SIZE = 1 << 20
+QUERY_BATCH = 500
+
+
+def normalize(sentence):
+    # BERT's basic tokenizer splits on whitespace, so runs of it never change the ids
+    return " ".join(sentence.split())
+
+
+def sentence_key(sentence):
+    return hashlib.blake2b(normalize(sentence).encode("utf-8"), digest_size=16).digest()
+
+
+def load_file_digests(memo_path):
+    if not memo_path or not os.path.exists(memo_path):
+        return {}
+    try:
+        with open(memo_path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_file_digests(digests, memo_path):
+    # every scoring worker may write it; a per-process temp file keeps the replace atomic
+    tmp_path = f"{memo_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(digests, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, memo_path)
+
+
+def file_digest(file_path, digests):
+    # the sha256 of the whole file, streamed, and remembered under its path, size and mtime
+    # so a worker only reads the weights again after they were rewritten
+    stat = os.stat(file_path)
+    memo_key = f"{os.path.abspath(file_path)}|{stat.st_size}|{stat.st_mtime_ns}"
+    if memo_key not in digests:
+        digest = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(BLOCK_SIZE), b""):
+                digest.update(block)
+        digests[memo_key] = digest.hexdigest()
+    return digests[memo_key]
+
+
+def model_fingerprint(paths, *params, memo_path=None):
+    # every file of the model and tokenizer is hashed by content: a model re-exported from a
+    # retrained teacher usually keeps both the name and the size of its weight files
+    digests = load_file_digests(memo_path)
+    known = len(digests)
+    digest = hashlib.sha256()
+    for path in paths:
+        files = [path] if os.path.isfile(path) else sorted(
+            os.path.join(folder, name) for folder, _, names in os.walk(path) for name in names)
+        for file_path in files:
+            digest.update(f"{os.path.relpath(file_path, path)}|{file_digest(file_path, digests)}".encode("utf-8"))
+    if memo_path and len(digests) != known:
+        save_file_digests(digests, memo_path)
+    digest.update("|".join(str(p) for p in params).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+class ScoreCache:
+    def __init__(self, path, fingerprint, lru_size=LRU_SIZE):
+        self.fingerprint = fingerprint
+        self.lru = OrderedDict()
+        self.lru_size = lru_size
+        self.memory_hits = self.disk_hits = self.misses = 0
+        # the scoring pipeline reads from tokenizer threads and writes from the writer thread
+        self.lock = threading.RLock()
+        self.db = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        # WAL lets the scoring workers read while one of them writes
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS scores (fingerprint TEXT, key BLOB, negative REAL, positive REAL,"
+                        " PRIMARY KEY (fingerprint, key)) WITHOUT ROWID")
+
+    def _remember(self, key, probs):
+        self.lru[key] = probs
+        self.lru.move_to_end(key)
+        if len(self.lru) > self.lru_size:
+            self.lru.popitem(last=False)
+
+    def get_many(self, keys):
+        with self.lock, metrics.stage("cache_lookup", len(keys)):
+            return self._get_many(keys)
+
+    def _get_many(self, keys):
+        found = {}
+        wanted = []
+        for key in set(keys):
+            if key in self.lru:
+                self.lru.move_to_end(key)
+                found[key] = self.lru[key]
+            else:
+                wanted.append(key)
+        for start in range(0, len(wanted), QUERY_BATCH):
+            part = wanted[start:start + QUERY_BATCH]
+            rows = self.db.execute(
+                f"SELECT key, negative, positive FROM scores WHERE fingerprint = ? AND key IN ({','.join('?' * len(part))})",
+                [self.fingerprint] + part)
+            for key, negative, positive in rows:
+                found[key] = (negative, positive)
+                self._remember(key, (negative, positive))
+        wanted = set(wanted)
+        for key in keys:
+            if key not in found:
+                self.misses += 1
+            elif key in wanted:
+                self.disk_hits += 1
+            else:
+                self.memory_hits += 1
+        return found
+
+    def put_many(self, scores):
+        # scores: key -> (negative, positive)
+        rows = [(self.fingerprint, key, float(p[0]), float(p[1])) for key, p in scores.items()]
+        with self.lock, self.db, metrics.stage("cache_store", len(rows)):
+            for _, key, negative, positive in rows:
+                self._remember(key, (negative, positive))
+            self.db.executemany("INSERT OR REPLACE INTO scores VALUES (?, ?, ?, ?)", rows)
+
+    def prune(self):
+        # drops entries written by any other model
+        with self.lock, self.db:
+            return self.db.execute("DELETE FROM scores WHERE fingerprint != ?", (self.fingerprint,)).rowcount
+
+    def stats(self):
+        total = self.memory_hits + self.disk_hits + self.misses
+        return {"memory_hits": self.memory_hits, "disk_hits": self.disk_hits, "misses": self.misses,
+                "hit_rate": round((self.memory_hits + self.disk_hits) / total, 4) if total else 0.0}
+
+
+def open_score_cache(path, model_path, tokenizer_path, max_length):
+    if not path:
+        return None
+    return ScoreCache(path, model_fingerprint([model_path, tokenizer_path], max_length,
+                                              memo_path=path + ".files.json"))
@@ -0,0 +1,56 @@
+# score_panel.py
+# The scored reports of a date range as a sparse stock x date panel: sorted stock codes and
+# report dates give every (股票代码, 发布日期) an integer row and column, and only the cells
+# that have a report are stored (CSR). Memory grows with the number of reports, not with
+# stocks x days. 08 and 09 build it from the store's per-day scores (daily_scores) and
+# factor_engine works on it directly; it is only made dense when a spreadsheet is written.
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+class ScorePanel:
+    def __init__(self, codes, dates, matrix):
+        self.codes = np.asarray(codes, dtype=object)
+        self.dates = np.asarray(dates, dtype=object)
+        self.matrix = sparse.csr_matrix(matrix)
+
+    @property
+    def shape(self):
+        return self.matrix.shape
+
+    @property
+    def nnz(self):
+        return self.matrix.nnz
+
+    def select_dates(self, columns):
+        return ScorePanel(self.codes, self.dates[columns], self.matrix[:, columns])
+
+    def to_frame(self):
+        # the layout 08 has always written: one row per stock, one column per date, 0 where
+        # the stock had no report
+        df = pd.DataFrame(self.matrix.toarray(), columns=list(self.dates))
+        df.insert(0, '股票代码', self.codes)
+        return df
+
+    def to_pivot(self, index_name='Date'):
+        # dates down, stocks across, as in pivoted.xlsx
+        return pd.DataFrame(self.matrix.T.toarray(), index=pd.Index(self.dates, name=index_name),
+                            columns=pd.Index(self.codes, name='股票代码'))
+
+
+def from_triples(codes, dates, scores):
+    # one cell per (stock, date); a duplicate keeps the last value
+    df = pd.DataFrame({'股票代码': codes, '发布日期': dates, '综合得分': scores})
+    df = df.dropna().drop_duplicates(['股票代码', '发布日期'], keep='last')
+    code_values, rows = np.unique(df['股票代码'].to_numpy(dtype=object), return_inverse=True)
+    date_values, cols = np.unique(df['发布日期'].to_numpy(dtype=object), return_inverse=True)
+    matrix = sparse.csr_matrix((df['综合得分'].to_numpy(dtype=np.float64), (rows, cols)),
+                               shape=(len(code_values), len(date_values)))
+    return ScorePanel(code_values, date_values, matrix)
+
+
+def load_panel(store, start_date=None, end_date=None, reducer="mean"):
+    # several reports of a stock on one date are reduced by the store (see daily_scores)
+    df = store.daily_scores(start_date, end_date, reducer)
+    return from_triples(df['股票代码'], df['发布日期'], df['综合得分'])
@@ -0,0 +1,90 @@
+# score_sinks.py
+# Where scored reports go: sentence predictions plus the report's 综合得分.
+# Both sinks are idempotent, so a report scored twice (restart, retry) leaves one copy
+# of its sentence documents keyed by (关联文档ID, 句子序号).
+
+import pandas as pd
+from run_metrics import metrics
+from report_store import PROCESSED_TABLE, SENTENCE_TABLE, open_store, read_month, write_month
+
+WRITE_BATCH = 500
+
+
+class MongoScoreSink:
+    def __init__(self, batch_size=WRITE_BATCH):
+        import pymongo
+        self.pymongo = pymongo
+        self.source_collection = open_store("mongo", PROCESSED_TABLE).collection
+        self.sentiment_collection = open_store("mongo", SENTENCE_TABLE).collection
+        self.sentiment_collection.create_index(
+            [('关联文档ID', pymongo.ASCENDING), ('句子序号', pymongo.ASCENDING)],
+            unique=True, partialFilterExpression={'句子序号': {'$exists': True}})
+        self.batch_size = batch_size
+        self.sentence_ops = []
+        self.score_ops = []
+
+    def write(self, report, result):
+        pymongo = self.pymongo
+        docs = result['sentiment_docs']
+        # sentence documents from before 句子序号 existed cannot be matched by the upserts below
+        self.sentence_ops.append(pymongo.DeleteMany({'关联文档ID': report['_id'], '句子序号': {'$exists': False}}))
+        for doc in docs:
+            self.sentence_ops.append(pymongo.ReplaceOne(
+                {'关联文档ID': doc['关联文档ID'], '句子序号': doc['句子序号']}, doc, upsert=True))
+        # a rescored report may have fewer sentences than last time
+        self.sentence_ops.append(pymongo.DeleteMany({'关联文档ID': report['_id'], '句子序号': {'$gte': len(docs)}}))
+        self.score_ops.append(pymongo.UpdateOne({'_id': report['_id']}, {'$set': {'综合得分': result['avg_score']}}))
+        if len(self.score_ops) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.sentence_ops and not self.score_ops:
+            return
+        # sentences land before the score, so a scored report always has its sentences
+        with metrics.stage("write", len(self.score_ops)):
+            if self.sentence_ops:
+                self.sentiment_collection.bulk_write(self.sentence_ops, ordered=False)
+            if self.score_ops:
+                self.source_collection.bulk_write(self.score_ops, ordered=False)
+        self.sentence_ops = []
+        self.score_ops = []
+
+
+class ParquetScoreSink:
+    # buffers one month of results, the cursor is date-sorted so each partition is rewritten once
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        self.source = open_store("parquet", PROCESSED_TABLE, store_dir)
+        self.month = None
+        self.scores = []
+        self.sentences = []
+
+    def write(self, report, result):
+        month = report['发布日期'][:7]
+        if self.month is not None and month != self.month:
+            self.flush()
+        self.month = month
+        self.sentences.extend(result['sentiment_docs'])
+        self.scores.append({'报告链接': report['报告链接'], '发布日期': report['发布日期'], '综合得分': result['avg_score']})
+
+    def flush(self):
+        if not self.scores:
+            return
+        with metrics.stage("write", len(self.scores)):
+            self._write_month()
+        self.scores = []
+        self.sentences = []
+
+    def _write_month(self):
+        year, month = self.month.split('-')
+        if self.sentences:
+            existing = read_month(self.store_dir, SENTENCE_TABLE, year, month)
+            scored = {score['报告链接'] for score in self.scores}
+            existing = existing[~existing['关联文档ID'].isin(scored)]
+            write_month(self.store_dir, SENTENCE_TABLE, year, month,
+                        pd.concat([existing, pd.DataFrame(self.sentences)], ignore_index=True))
+        self.source.update_scores(pd.DataFrame(self.scores))
+
+
+def open_sink(backend, store_dir):
+    return ParquetScoreSink(store_dir) if backend == "parquet" else MongoScoreSink()
@@ -0,0 +1,242 @@
+# scoring.py
+# Sentence scoring helpers for 07: the per-report result documents and pooled,
+# length-sorted batching of sentences across many reports.
+#
+# predict(input_ids, attention_mask) -> (n, 2) array of class probabilities is the only
+# thing the batching needs from the model, so any backend can sit behind it.
+
+import numpy as np
+from score_cache import sentence_key
+from run_metrics import metrics
+
+TOKENIZER_PATH = r'D:\Projects\bert'
+MODEL_PATH = r'D:\Projects\report-analysis\trained_model'
+ONNX_MODEL_PATH = r'D:\Projects\report-analysis\trained_model.int8.onnx'
+STUDENT_MODEL_PATH = r'D:\Projects\report-analysis\student_model'
+ENGINES = ["tf", "onnx"]
+MODEL_PATHS = {"tf": MODEL_PATH, "onnx": ONNX_MODEL_PATH}
+# --model also accepts these names
+NAMED_MODELS = {"teacher": MODEL_PATH, "student": STUDENT_MODEL_PATH}
+MAX_LENGTH = 500
+BATCH_SIZE = 32
+ORT_PROVIDERS = ["CPUExecutionProvider"]
+ORT_INTER_THREADS = 1
+ORT_OPTIMIZATION = "ORT_ENABLE_ALL"
+
+
+def configure_threads(intra_op=0, inter_op=0):
+    # must run before the first TF op; 0 leaves TF's own default
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(intra_op)
+    tf.config.threading.set_inter_op_parallelism_threads(inter_op)
+
+
+def resolve_model(engine, model=None):
+    if model is None:
+        return MODEL_PATHS[engine]
+    return NAMED_MODELS.get(model, model)
+
+
+def model_engine(model_path):
+    # an .onnx file is run by ONNX Runtime, anything else is a SavedModel directory
+    return "onnx" if str(model_path).lower().endswith(".onnx") else "tf"
+
+
+def load_tokenizer(path=TOKENIZER_PATH, fast=False):
+    from transformers import BertTokenizer, BertTokenizerFast
+    return (BertTokenizerFast if fast else BertTokenizer).from_pretrained(path)
+
+
+def softmax(logits):
+    exp = np.exp(logits - logits.max(axis=-1, keepdims=True))
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+
+def load_tf_predictor(model_path=MODEL_PATH):
+    import tensorflow as tf
+    infer = tf.saved_model.load(model_path).signatures['serving_default']
+
+    def predict(input_ids, attention_mask):
+        with metrics.stage("forward", len(input_ids)):
+            input_ids = tf.constant(input_ids, dtype=tf.int32)
+            logits = infer(input_ids=input_ids, attention_mask=tf.constant(attention_mask, dtype=tf.int32),
+                           token_type_ids=tf.zeros_like(input_ids))['logits']
+        with metrics.stage("softmax", len(input_ids)):
+            return tf.nn.softmax(logits, axis=-1).numpy()
+    return predict
+
+
+def load_onnx_predictor(model_path=ONNX_MODEL_PATH, threads=0):
+    # the graph written by 20-export-onnx.py, run by ONNX Runtime with all graph optimizations
+    import onnxruntime as ort
+    options = ort.SessionOptions()
+    options.graph_optimization_level = getattr(ort.GraphOptimizationLevel, ORT_OPTIMIZATION)
+    options.intra_op_num_threads = threads
+    options.inter_op_num_threads = ORT_INTER_THREADS
+    session = ort.InferenceSession(model_path, options, providers=ORT_PROVIDERS)
+    inputs = {i.name.split(':')[0]: (i.name, np.int64 if 'int64' in i.type else np.int32) for i in session.get_inputs()}
+
+    def predict(input_ids, attention_mask):
+        feed = {'input_ids': input_ids, 'attention_mask': attention_mask, 'token_type_ids': np.zeros_like(input_ids)}
+        with metrics.stage("forward", len(input_ids)):
+            logits = session.run(None, {name: feed[key].astype(dtype) for key, (name, dtype) in inputs.items()})[0]
+        with metrics.stage("softmax", len(input_ids)):
+            return softmax(logits)
+    return predict
+
+
+def load_predictor(model_path=None, engine="tf", threads=0):
+    # threads only applies to onnx, TF takes its budget from configure_threads
+    if engine == "onnx":
+        return load_onnx_predictor(model_path or ONNX_MODEL_PATH, threads)
+    if engine == "tf":
+        return load_tf_predictor(model_path or MODEL_PATH)
+    raise ValueError(f"unknown engine : {engine}")
+
+
+def build_result(report, probs):
+    sentences = report['研报文本']
+    predictions = np.argmax(probs, axis=1)
+    sentiment_docs = []
+    adjusted_total = 0.0
+
+    for i, text in enumerate(sentences):
+        raw_prob = float(probs[i][1])
+        adjusted_score = raw_prob - 0.5
+        adjusted_total += adjusted_score
+        sentiment_docs.append({
+            '股票代码': report['股票代码'],
+            '发布日期': report['发布日期'],
+            '研报标题': report['研报标题'],
+            '原始文本': text,
+            '句子序号': i,
+            '预测结果': '正面' if predictions[i] == 1 else '负面',
+            '原始正面概率': raw_prob,
+            '调整后得分': adjusted_score,
+            '关联文档ID': report.get('_id', report.get('报告链接'))
+        })
+
+    avg_score = adjusted_total / len(sentences) if sentences else 0
+    return {'sentiment_docs': sentiment_docs, 'avg_score': avg_score}
+
+
+def tokenize_sentences(tokenizer, sentences, max_length=MAX_LENGTH):
+    # no padding here, each batch is padded to its own longest member later
+    with metrics.stage("tokenize", len(sentences)):
+        return tokenizer(sentences, truncation=True, max_length=max_length)['input_ids']
+
+
+def pad_batch(token_ids, pad_id=0):
+    length = max(len(ids) for ids in token_ids)
+    input_ids = np.full((len(token_ids), length), pad_id, dtype=np.int32)
+    attention_mask = np.zeros((len(token_ids), length), dtype=np.int32)
+    for i, ids in enumerate(token_ids):
+        input_ids[i, :len(ids)] = ids
+        attention_mask[i, :len(ids)] = 1
+    return input_ids, attention_mask
+
+
+def length_batches(lengths, batch_size=BATCH_SIZE):
+    # sorting by token count keeps every batch full and its padding tight
+    order = np.argsort(lengths, kind='stable')
+    return [order[start:start + batch_size] for start in range(0, len(order), batch_size)]
+
+
+def score_token_ids(token_ids, predict, batch_size=BATCH_SIZE, pad_id=0):
+    lengths = np.fromiter((len(ids) for ids in token_ids), dtype=np.int64, count=len(token_ids))
+    probs = np.empty((len(token_ids), 2), dtype=np.float32)
+    for index in length_batches(lengths, batch_size):
+        input_ids, attention_mask = pad_batch([token_ids[i] for i in index], pad_id)
+        probs[index] = predict(input_ids, attention_mask)
+    return probs
+
+
+def gather_token_ids(scored, todo, tokenizer, max_length=MAX_LENGTH, token_store=None):
+    # ids for the flat sentence positions in todo, from the token store where it has the
+    # report, with the rest tokenized in one call
+    counts = [len(report['研报文本']) for report in scored]
+    starts = np.concatenate([[0], np.cumsum(counts)])
+    owners = np.searchsorted(starts, todo, side='right') - 1
+    stored = {}
+    if token_store is not None:
+        for owner in set(owners.tolist()):
+            stored[owner] = token_store.lookup(scored[owner])
+    token_ids = [None] * len(todo)
+    missing = []
+    for j, (i, owner) in enumerate(zip(todo, owners)):
+        if stored.get(owner) is not None:
+            token_ids[j] = stored[owner][i - starts[owner]]
+        else:
+            missing.append(j)
+    if missing:
+        texts = [scored[owners[j]]['研报文本'][todo[j] - starts[owners[j]]] for j in missing]
+        for j, ids in zip(missing, tokenize_sentences(tokenizer, texts, max_length)):
+            token_ids[j] = ids
+    return token_ids
+
+
+def prepare_pool(reports, tokenizer, max_length=MAX_LENGTH, token_store=None, cache=None):
+    # everything before the model: cache lookups and token ids for the sentences to score.
+    # Returns None when no report has sentences.
+    scored = [report for report in reports if report.get('研报文本')]
+    sentences = [sentence for report in scored for sentence in report['研报文本']]
+    if not sentences:
+        return None
+    pool = {'reports': scored, 'probs': np.empty((len(sentences), 2), dtype=np.float32),
+            'todo': list(range(len(sentences))), 'keys': None}
+    if cache is not None:
+        keys = [sentence_key(sentence) for sentence in sentences]
+        found = cache.get_many(keys)
+        first = {}
+        todo = []
+        for i, key in enumerate(keys):
+            if key in found:
+                pool['probs'][i] = found[key]
+            elif key not in first:
+                first[key] = i
+                todo.append(i)
+        pool.update(keys=keys, found=found, first=first, todo=todo)
+    pool['token_ids'] = gather_token_ids(scored, np.asarray(pool['todo']), tokenizer, max_length, token_store) \
+        if pool['todo'] else []
+    return pool
+
+
+def infer_pool(pool, predict, batch_size=BATCH_SIZE, pad_id=0):
+    if pool['todo']:
+        pool['probs'][pool['todo']] = score_token_ids(pool['token_ids'], predict, batch_size, pad_id)
+    return pool
+
+
+def finish_pool(pool, cache=None):
+    with metrics.stage("postprocess", len(pool['reports'])):
+        return _finish_pool(pool, cache)
+
+
+def _finish_pool(pool, cache):
+    probs = pool['probs']
+    if cache is not None:
+        keys, found, first = pool['keys'], pool['found'], pool['first']
+        cache.put_many({keys[i]: probs[i] for i in pool['todo']})
+        for i, key in enumerate(keys):
+            if key not in found:
+                probs[i] = probs[first[key]]
+
+    results = []
+    position = 0
+    for report in pool['reports']:
+        count = len(report['研报文本'])
+        results.append((report, build_result(report, probs[position:position + count])))
+        position += count
+    return results
+
+
+def score_reports(reports, tokenizer, predict, batch_size=BATCH_SIZE, max_length=MAX_LENGTH,
+                  token_store=None, cache=None):
+    # pools the sentences of all reports, scores them in length-sorted batches and
+    # scatters the probabilities back; reports without sentences are skipped as in 07.
+    # With a token store only reports it does not hold (or holds stale) are tokenized,
+    # with a score cache only sentences it has not seen reach the model.
+    pool = prepare_pool(reports, tokenizer, max_length, token_store, cache)
+    if pool is None:
+        return []
+    return finish_pool(infer_pool(pool, predict, batch_size, tokenizer.pad_token_id), cache)
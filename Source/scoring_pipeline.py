@@ -0,0 +1,159 @@
+# scoring_pipeline.py
+# Overlapped scoring for 07/18. A reader thread pulls reports from the cursor into pools, a
+# small thread pool prepares them (cache lookups, token ids), the calling thread does nothing
+# but run the model, and a writer thread builds the result documents and hands them to the
+# sink. Every hand-off is a bounded queue, so a slow stage holds the others back instead of
+# piling pools up in memory.
+
+import copy
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from run_metrics import metrics
+from scoring import BATCH_SIZE, MAX_LENGTH, finish_pool, infer_pool, prepare_pool, score_reports
+
+QUEUE_DEPTH = 4
+POOL_SENTENCES = 4096
+DONE = object()
+
+
+def _put(q, item, stop):
+    # gives up once the pipeline is stopping, so no stage blocks forever on a dead neighbour
+    while True:
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            if stop.is_set():
+                return False
+
+
+def run_pipeline(cursor, tokenizer, predict, write, batch_size=BATCH_SIZE, max_length=MAX_LENGTH,
+                 pool_sentences=POOL_SENTENCES, token_store=None, cache=None, tokenizer_threads=2,
+                 depth=QUEUE_DEPTH):
+    # write(results) is called from the writer thread with [(report, result)] in cursor order.
+    # Ctrl-C stops reading, pools already scored are still written, then it is re-raised.
+    stop = threading.Event()
+    errors = []
+    prepared = queue.Queue(depth)
+    finished = queue.Queue(depth)
+    preparing = ThreadPoolExecutor(max_workers=tokenizer_threads)
+    stats = {"pools": 0, "reports": 0, "failed": 0,
+             "infer_seconds": 0.0, "starved_seconds": 0.0, "blocked_seconds": 0.0}
+
+    # a fast tokenizer encodes without holding the GIL, which is what lets these threads overlap
+    # with inference, but it keeps its truncation settings as mutable state, so each thread
+    # works on its own copy
+    local = threading.local()
+
+    def prepare(pool):
+        if not hasattr(local, "tokenizer"):
+            local.tokenizer = copy.deepcopy(tokenizer)
+        return prepare_pool(pool, local.tokenizer, max_length, token_store, cache)
+
+    def submit(pool):
+        future = preparing.submit(prepare, pool)
+        return _put(prepared, (pool, future), stop)
+
+    def read():
+        try:
+            pool = []
+            pooled = 0
+            for report in metrics.timed_iter(cursor, "fetch"):
+                if stop.is_set():
+                    return
+                pool.append(report)
+                pooled += len(report.get('研报文本') or [])
+                if pooled >= pool_sentences:
+                    if not submit(pool):
+                        return
+                    pool = []
+                    pooled = 0
+            if pool:
+                submit(pool)
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            _put(prepared, DONE, stop)
+
+    def write_behind():
+        while True:
+            item = finished.get()
+            if item is DONE:
+                return
+            try:
+                kind, payload = item
+                results = finish_pool(payload, cache) if kind == "pool" else payload
+                write(results)
+                stats["reports"] += len(results)
+            except Exception as e:
+                errors.append(e)
+                stop.set()
+                return
+
+    reader = threading.Thread(target=read, daemon=True)
+    writer = threading.Thread(target=write_behind, daemon=True)
+    reader.start()
+    writer.start()
+    interrupted = False
+    try:
+        while not stop.is_set():
+            begin = time.time()
+            try:
+                item = prepared.get(timeout=0.1)
+            except queue.Empty:
+                stats["starved_seconds"] += time.time() - begin
+                metrics.add("infer_starved", time.time() - begin, 0)
+                continue
+            stats["starved_seconds"] += time.time() - begin
+            metrics.add("infer_starved", time.time() - begin, 0)
+            if item is DONE:
+                break
+            reports, future = item
+            begin = time.time()
+            try:
+                pool = future.result()
+                if pool is None:
+                    continue
+                item = ("pool", infer_pool(pool, predict, batch_size, tokenizer.pad_token_id))
+            except Exception as e:
+                # fall back to one report at a time to isolate the one that broke the pool
+                print(f'pooled scoring failed ({str(e)}), retrying report by report')
+                results = []
+                for report in reports:
+                    try:
+                        results.extend(score_reports([report], tokenizer, predict, batch_size, max_length,
+                                                     token_store, cache))
+                    except Exception as e:
+                        print(f'error when processing {report.get("_id", report.get("报告链接"))}:{str(e)}')
+                        stats["failed"] += 1
+                item = ("results", results)
+            stats["infer_seconds"] += time.time() - begin
+            stats["pools"] += 1
+            begin = time.time()
+            if not _put(finished, item, stop):
+                break
+            stats["blocked_seconds"] += time.time() - begin
+            metrics.add("infer_blocked", time.time() - begin, 0)
+    except KeyboardInterrupt:
+        interrupted = True
+    finally:
+        # drain: stop reading, let the writer finish what was scored, then close everything
+        stop.set()
+        preparing.shutdown(wait=True, cancel_futures=True)
+        while writer.is_alive():
+            try:
+                finished.put(DONE, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        writer.join()
+        reader.join(timeout=5)
+
+    if interrupted:
+        raise KeyboardInterrupt
+    if errors:
+        raise errors[0]
+    return stats
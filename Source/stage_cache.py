@@ -0,0 +1,111 @@
+# stage_cache.py
+# On-disk cache for the research pipeline (28). Every stage output is stored under
+# <cache>/<stage>/<key>, where the key hashes the stage's parameters together with the keys
+# of its inputs. A changed parameter therefore reruns its stage and everything downstream,
+# and nothing else. Inputs are only loaded when a stage actually has to run. Frames are
+# pickled (they carry periods and integer column names), panels are factor-panel directories.
+
+import hashlib
+import json
+import os
+import time
+import numpy as np
+import pandas as pd
+from factor_panel import load_factor_panel, save_factor_panel
+
+CACHE_DIR = "pipeline_cache"
+
+
+def digest(*parts):
+    text = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=10).hexdigest()
+
+
+def files_fingerprint(paths):
+    # name, size and mtime stand in for the contents of input files
+    fingerprint = []
+    for path in sorted(paths):
+        stat = os.stat(path)
+        fingerprint.append([os.path.basename(path), stat.st_size, int(stat.st_mtime)])
+    return digest(fingerprint)
+
+
+def content_digest(value):
+    h = hashlib.blake2b(digest_size=10)
+    if isinstance(value, pd.DataFrame):
+        h.update(pd.util.hash_pandas_object(value, index=True).values.tobytes())
+        h.update(json.dumps([str(c) for c in value.columns]).encode("utf-8"))
+    else:
+        matrix = value.matrix
+        for array in [value.codes.astype(str), value.dates.astype(str), matrix.data, matrix.indices, matrix.indptr]:
+            h.update(np.ascontiguousarray(array).tobytes())
+    return h.hexdigest()
+
+
+def save_frame(df, path):
+    tmp_path = path + ".tmp"
+    df.to_pickle(tmp_path)
+    os.replace(tmp_path, path)
+
+
+KINDS = {
+    "frame": (".pkl", save_frame, pd.read_pickle),
+    "panel": ("", save_factor_panel, load_factor_panel),
+}
+
+
+class Artifact:
+    def __init__(self, key, load):
+        self.key = key
+        self._load = load
+        self._value = None
+
+    @property
+    def value(self):
+        if self._value is None:
+            self._value = self._load()
+        return self._value
+
+
+class StageCache:
+    def __init__(self, root=CACHE_DIR, force=()):
+        self.root = root
+        self.force = set(force)
+        self.log = []
+
+    def _path(self, name, key, kind):
+        return os.path.join(self.root, name, key + KINDS[kind][0])
+
+    def _store(self, name, key, kind, value, begin):
+        # a forced stage replaces what is stored under its key (a refetched index can differ
+        # under the same key); both writers go through a temp path, so readers never see half
+        path = self._path(name, key, kind)
+        if name in self.force or not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            KINDS[kind][1](value, path)
+        self._report(name, key, "computed", time.time() - begin)
+        artifact = Artifact(key, None)
+        artifact._value = value
+        return artifact
+
+    def _report(self, name, key, status, seconds):
+        self.log.append({"stage": name, "key": key, "status": status, "seconds": round(seconds, 2)})
+        print(f"{name:<16} {status:<9} {key}  {seconds:.2f}s")
+
+    def stage(self, name, kind, params, inputs, compute):
+        # compute(**values of inputs) runs only when no output is cached under the key
+        key = digest(name, params, {input_name: artifact.key for input_name, artifact in inputs.items()})
+        path = self._path(name, key, kind)
+        if name not in self.force and os.path.exists(path):
+            self._report(name, key, "cached", 0.0)
+            return Artifact(key, lambda: KINDS[kind][2](path))
+        begin = time.time()
+        value = compute(**{input_name: artifact.value for input_name, artifact in inputs.items()})
+        return self._store(name, key, kind, value, begin)
+
+    def source(self, name, kind, compute):
+        # for inputs that cannot be fingerprinted cheaply (a live database): always computed,
+        # keyed by its content, so unchanged data still hits every cache downstream
+        begin = time.time()
+        value = compute()
+        return self._store(name, digest(name, content_digest(value)), kind, value, begin)
@@ -0,0 +1,119 @@
+# text_cleaning.py
+# Report text cleaning rules shared by 04, 05 and 16, with the patterns compiled once,
+# plus batch kernels that apply the same rules to a whole column with pyarrow.compute.
+
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+CONTROL_PATTERN = re.compile(r'[\n\r\t]')
+DISALLOWED_PATTERN = re.compile(r'[^a-zA-Z0-9\u4e00-\u9fa5\s,.。，!？！:;()\-+*/&^%$#@=_<>]')
+RISK_WARNING_PATTERN = re.compile(r'风险提示：[^\n]*')
+SENTENCE_PATTERN = re.compile(r'(?<=。)')
+MEANINGLESS_PREFIXES = ("数据来源", "相关资料", "本报告不构成投资建议", "免责声明", "资料来源", "数据来自")
+
+
+def clean_escaped_characters(text):
+    if isinstance(text, str):
+        processed = CONTROL_PATTERN.sub('', text)
+        processed = DISALLOWED_PATTERN.sub('', processed)
+        return processed
+    return text
+
+
+def remove_risk_warning(text):
+    if isinstance(text, str):
+        return RISK_WARNING_PATTERN.sub('', text)
+    return text
+
+
+def split_by_sentence(text):
+    if isinstance(text, str):
+        sentences = SENTENCE_PATTERN.split(text)
+        return [sentence.strip() for sentence in sentences if sentence.strip()]
+    return []
+
+
+def is_meaningless(text):
+    return text.startswith(MEANINGLESS_PREFIXES)
+
+
+def filter_report(report):
+    return [sentence for sentence in split_by_sentence(report) if not is_meaningless(sentence)]
+
+
+def clean_report(report):
+    # 04 and 05 in one call: clean -> strip risk warning -> split -> drop boilerplate.
+    # None means nothing is left after cleaning and 05 would have skipped the report.
+    cleaned = remove_risk_warning(clean_escaped_characters(report))
+    if not isinstance(cleaned, str) or not cleaned:
+        return None
+    return filter_report(cleaned)
+
+
+# pyarrow uses RE2, whose \\s is ASCII-only and which has no lookbehind, so the batch
+# patterns spell out Python's Unicode whitespace and the split is done on a literal 。
+PY_WHITESPACE = "".join(chr(c) for c in range(sys.maxunicode + 1) if chr(c).isspace())
+# \n \r \t are left out of the allowed whitespace so one pass does both deletions of
+# clean_escaped_characters
+_RE2_WHITESPACE = "".join(f"\\x{{{ord(c):x}}}" for c in PY_WHITESPACE if c not in "\n\r\t")
+RE2_DISALLOWED = r'[^a-zA-Z0-9\x{4e00}-\x{9fa5}' + _RE2_WHITESPACE + r',.。，!？！:;()\-+*/&^%$#@=_<>]'
+RE2_RISK_WARNING = r'风险提示：[^\n]*'
+RE2_MEANINGLESS = "^(?:" + "|".join(MEANINGLESS_PREFIXES) + ")"
+
+
+def _clean_slice(texts):
+    cleaned = pc.replace_substring_regex(texts, RE2_DISALLOWED, "")
+    cleaned = pc.replace_substring_regex(cleaned, RE2_RISK_WARNING, "")
+    kept = pc.fill_null(pc.greater(pc.utf8_length(cleaned), 0), False)
+
+    pieces = pc.split_pattern(pc.if_else(kept, cleaned, pa.scalar(None, pa.string())), "。")
+    parents = pc.list_parent_indices(pieces).to_numpy()
+    flat = pc.list_flatten(pieces)
+    # re.split(r'(?<=。)') keeps the delimiter on every piece but the last of a report
+    offsets = pieces.offsets.to_numpy()
+    offsets = offsets - offsets[0]
+    not_last = np.ones(len(flat), dtype=bool)
+    not_last[offsets[1:][offsets[1:] > offsets[:-1]] - 1] = False
+    flat = pc.if_else(pa.array(not_last), pc.binary_join_element_wise(flat, "。", ""), flat)
+    flat = pc.utf8_trim(flat, characters=PY_WHITESPACE)
+
+    keep = pc.and_(pc.greater(pc.utf8_length(flat), 0),
+                   pc.invert(pc.match_substring_regex(flat, RE2_MEANINGLESS)))
+    keep_mask = keep.to_numpy(zero_copy_only=False)
+    return flat.filter(keep), parents[keep_mask], kept.to_numpy(zero_copy_only=False)
+
+
+def clean_batch(texts, workers=1):
+    # texts: any sequence / pyarrow array of report texts (non-strings count as missing).
+    # Returns (sentences, parents, kept): the surviving sentences as a pyarrow string array,
+    # the index of each sentence's report, and which reports still have text after cleaning.
+    # The compute kernels release the GIL, so slices of one batch can run on threads.
+    if not isinstance(texts, (pa.Array, pa.ChunkedArray)):
+        texts = pa.array([t if isinstance(t, str) else None for t in texts], pa.string())
+    if isinstance(texts, pa.ChunkedArray):
+        texts = texts.combine_chunks()
+    if workers <= 1 or len(texts) < 2 * workers:
+        return _clean_slice(texts)
+    step = -(-len(texts) // workers)
+    starts = range(0, len(texts), step)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        parts = list(pool.map(_clean_slice, [texts.slice(start, step) for start in starts]))
+    return (pa.concat_arrays([part[0] for part in parts]),
+            np.concatenate([part[1] + start for part, start in zip(parts, starts)]),
+            np.concatenate([part[2] for part in parts]))
+
+
+def group_sentences(sentences, parents, kept):
+    # per-report lists in clean_report form: None for dropped reports, else the sentence list
+    grouped = [[] if k else None for k in kept]
+    for parent, sentence in zip(parents.tolist(), sentences.to_pylist()):
+        grouped[parent].append(sentence)
+    return grouped
+
+
+def clean_reports(texts, workers=1):
+    return group_sentences(*clean_batch(texts, workers))
@@ -0,0 +1,130 @@
+# token_store.py
+# Pre-tokenized corpus on disk, built by 19-tokenize-corpus.py and read by 06, 07 and 18.
+# All token ids sit in one flat int32 file with an offsets array beside it, so every
+# sentence is a zero-copy slice of a memory map. A store lives in <root>/<name>-<key>,
+# where the key hashes the tokenizer vocab and max length, so ids made by another
+# tokenizer are never picked up.
+
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+from scoring import pad_batch
+
+TOKEN_DIR = r"D:\Projects\token-store"
+IDS_FILE = "ids.bin"
+META_FILE = "meta.json"
+KEYS_FILE = "reports.json"
+ARRAYS = ["offsets", "lengths", "sentence_report", "report_offsets", "text_hash", "labels"]
+
+
+def tokenizer_key(tokenizer, max_length):
+    vocab = json.dumps(sorted(tokenizer.get_vocab().items()), ensure_ascii=False)
+    return hashlib.sha256(f"{vocab}|{max_length}".encode("utf-8")).hexdigest()[:16]
+
+
+def store_path(root, name, tokenizer, max_length):
+    return os.path.join(root, f"{name}-{tokenizer_key(tokenizer, max_length)}")
+
+
+def report_key(report):
+    # the same id 07 writes into 关联文档ID
+    return str(report.get('_id', report.get('报告链接')))
+
+
+def text_hash(sentences):
+    digest = hashlib.blake2b("\n".join(sentences).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+class TokenStoreWriter:
+    # streams ids to disk as reports are added; nothing is visible until close()
+    def __init__(self, path, tokenizer, max_length):
+        self.path = path
+        self.tmp_path = path + ".tmp"
+        shutil.rmtree(self.tmp_path, ignore_errors=True)
+        os.makedirs(self.tmp_path)
+        self.ids_file = open(os.path.join(self.tmp_path, IDS_FILE), "wb")
+        self.meta = {"max_length": max_length, "pad_token_id": tokenizer.pad_token_id,
+                     "key": tokenizer_key(tokenizer, max_length)}
+        self.keys = []
+        self.lengths = []
+        self.sentence_report = []
+        self.report_offsets = [0]
+        self.text_hash = []
+        self.labels = []
+
+    def add(self, key, sentences, token_ids, label=None):
+        report = len(self.keys)
+        self.keys.append(key)
+        self.text_hash.append(text_hash(sentences))
+        for ids in token_ids:
+            self.ids_file.write(np.asarray(ids, dtype=np.int32).tobytes())
+            self.lengths.append(len(ids))
+            self.sentence_report.append(report)
+        self.report_offsets.append(len(self.lengths))
+        if label is not None:
+            self.labels.append(label)
+
+    def close(self):
+        self.ids_file.close()
+        lengths = np.asarray(self.lengths, dtype=np.int32)
+        arrays = {
+            "offsets": np.concatenate([[0], np.cumsum(lengths, dtype=np.int64)]),
+            "lengths": lengths,
+            "sentence_report": np.asarray(self.sentence_report, dtype=np.int32),
+            "report_offsets": np.asarray(self.report_offsets, dtype=np.int64),
+            "text_hash": np.asarray(self.text_hash, dtype=np.uint64),
+            "labels": np.asarray(self.labels, dtype=np.int32),
+        }
+        for name, array in arrays.items():
+            np.save(os.path.join(self.tmp_path, f"{name}.npy"), array)
+        with open(os.path.join(self.tmp_path, KEYS_FILE), "w", encoding="utf-8") as f:
+            json.dump(self.keys, f, ensure_ascii=False)
+        self.meta.update(sentences=len(lengths), reports=len(self.keys), tokens=int(lengths.sum()))
+        with open(os.path.join(self.tmp_path, META_FILE), "w", encoding="utf-8") as f:
+            json.dump(self.meta, f, indent=2)
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.replace(self.tmp_path, self.path)
+        return self.meta
+
+
+class TokenStore:
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, META_FILE), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.pad_token_id = self.meta["pad_token_id"]
+        self.ids = np.memmap(os.path.join(path, IDS_FILE), dtype=np.int32, mode="r") \
+            if self.meta["tokens"] else np.zeros(0, dtype=np.int32)
+        for name in ARRAYS:
+            setattr(self, name, np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r"))
+        self._index = None
+
+    def __len__(self):
+        return self.meta["sentences"]
+
+    def sentence(self, i):
+        return self.ids[self.offsets[i]:self.offsets[i + 1]]
+
+    def batch(self, indices):
+        return pad_batch([self.sentence(i) for i in indices], self.pad_token_id)
+
+    def index(self):
+        if self._index is None:
+            with open(os.path.join(self.path, KEYS_FILE), encoding="utf-8") as f:
+                self._index = {key: i for i, key in enumerate(json.load(f))}
+        return self._index
+
+    def lookup(self, report):
+        # stored ids for a report, or None when it is missing or its text has changed since
+        i = self.index().get(report_key(report))
+        if i is None or int(self.text_hash[i]) != text_hash(report['研报文本']):
+            return None
+        return [self.sentence(s) for s in range(self.report_offsets[i], self.report_offsets[i + 1])]
+
+
+def open_token_store(root, name, tokenizer, max_length):
+    path = store_path(root, name, tokenizer, max_length)
+    return TokenStore(path) if os.path.exists(os.path.join(path, META_FILE)) else None
@@ -0,0 +1,84 @@
+# training_data.py
+# Streaming input pipeline for fine-tuning (06): examples come lazily from the labelled csv
+# (tokenized chunk by chunk) or from the training token store written by 19, are bucketed
+# by length and padded per batch, so neither memory nor padding grows with the data set.
+
+import os
+import numpy as np
+import pandas as pd
+import tensorflow as tf
+from corpus_io import file_sha256
+
+BUCKET_BOUNDARIES = [16, 32, 64, 128, 256]
+VALIDATION_SHARE = 0.2
+SHUFFLE_BUFFER = 10000
+CSV_CHUNK = 10000
+
+
+def is_validation(rows, share=VALIDATION_SHARE):
+    # a fixed hash of the row number, so both sources and every epoch agree on the split
+    # without the row count being known up front
+    mixed = (np.asarray(rows, dtype=np.uint64) * np.uint64(2654435761)) % np.uint64(1 << 32)
+    return mixed < np.uint64(share * (1 << 32))
+
+
+def store_matches(token_store, data_path):
+    # the training store is only used for the csv it was built from: same size and content
+    # (an mtime says nothing about a copy or a rewrite within the same tick)
+    if token_store is None or token_store.meta.get("source_size") != os.path.getsize(data_path):
+        return False
+    return token_store.meta.get("source_sha256") == file_sha256(data_path)
+
+
+def in_shard(rows, validation, num_shards=1, shard_index=0):
+    # rows of one split that belong to this worker; every worker reads a disjoint slice
+    return (is_validation(rows) == validation) & (rows % num_shards == shard_index)
+
+
+def csv_examples(data_path, text_column, label_column, tokenizer, max_length, validation,
+                 num_shards=1, shard_index=0):
+    def generate():
+        row = 0
+        for chunk in pd.read_csv(data_path, usecols=[text_column, label_column], chunksize=CSV_CHUNK):
+            keep = in_shard(np.arange(row, row + len(chunk)), validation, num_shards, shard_index)
+            row += len(chunk)
+            texts = chunk[text_column].astype(str)[keep].tolist()
+            labels = chunk[label_column].values[keep]
+            if not texts:
+                continue
+            for ids, label in zip(tokenizer(texts, truncation=True, max_length=max_length)['input_ids'], labels):
+                yield np.asarray(ids, dtype=np.int32), int(label)
+    return generate
+
+
+def store_examples(token_store, validation, max_length, num_shards=1, shard_index=0):
+    rows = np.flatnonzero(in_shard(np.arange(len(token_store)), validation, num_shards, shard_index))
+
+    def generate():
+        for row in rows:
+            ids = token_store.sentence(row)
+            if len(ids) > max_length:
+                ids = np.append(ids[:max_length - 1], ids[-1])
+            yield np.asarray(ids), int(token_store.labels[row])
+    return generate
+
+
+def count_rows(data_path, text_column):
+    return sum(len(chunk) for chunk in pd.read_csv(data_path, usecols=[text_column], chunksize=CSV_CHUNK * 10))
+
+
+def make_dataset(generate, batch_size, pad_id=0, shuffle=False, boundaries=BUCKET_BOUNDARIES):
+    dataset = tf.data.Dataset.from_generator(generate, output_signature=(
+        tf.TensorSpec(shape=(None,), dtype=tf.int32), tf.TensorSpec(shape=(), dtype=tf.int64)))
+    if shuffle:
+        dataset = dataset.shuffle(SHUFFLE_BUFFER, reshuffle_each_iteration=True)
+    dataset = dataset.bucket_by_sequence_length(
+        lambda ids, label: tf.shape(ids)[0], boundaries, [batch_size] * (len(boundaries) + 1),
+        padding_values=(pad_id, tf.constant(0, dtype=tf.int64)))
+
+    def to_features(ids, labels):
+        # [PAD] never occurs inside a sentence, so the mask can be read off the ids
+        return {'input_ids': ids, 'token_type_ids': tf.zeros_like(ids),
+                'attention_mask': tf.cast(tf.not_equal(ids, pad_id), tf.int32)}, labels
+
+    return dataset.map(to_features, num_parallel_calls=tf.data.AUTOTUNE).prefetch(tf.data.AUTOTUNE)